@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+音频内核AOT预编译脚本
+用numba.pycc把audio_dsp_numba中的内核编译为扩展模块voip_dsp，
+运行时无需numba，也没有首次调用时的JIT编译延迟
+
+用法: python build_dsp.py
+生成的 voip_dsp.*.so / voip_dsp.*.pyd 位于本脚本所在目录，
+audio_dsp_numba导入时会优先使用它
+
+作者: RUIO
+日期: 2026年10月15日
+"""
+
+import os
+import sys
+
+try:
+    from numba.pycc import CC
+except ImportError:
+    print("❌ 需要安装numba（且版本提供numba.pycc）才能预编译音频内核")
+    sys.exit(1)
+
+import audio_dsp_numba as dsp
+
+# 导出签名与调用方传入的数组类型一致
+EXPORTS = {
+    'noise_gate': 'b1(i2[:], f8, i2[:])',
+    'echo_finish': 'f4[:](f4[:], f8, f4[:])',
+    'vad_features': 'Tuple((f8, f8, i8))(i2[:])',
+    'echo_scores': 'Tuple((f8, f8, i8, f8))(f4[:, :], i8, i8, f8, f8[:])',
+    'sum_squares_i16': 'i8(i2[:])',
+    'process_input_frame': 'b1(i2[:], i2[:], f8, f8, f8, b1, b1)',
+    'volume_q15': 'i2[:](i2[:], i4, i2[:])',
+}
+
+
+def main():
+    cc = CC('voip_dsp')
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+    cc.verbose = True
+    for name, signature in EXPORTS.items():
+        func = getattr(dsp, name)
+        # 已被njit装饰的函数取回原始Python函数再交给pycc
+        cc.export(name, signature)(getattr(func, 'py_func', func))
+    cc.compile()
+    print(f"✅ 音频内核已编译到: {cc.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -19,16 +19,23 @@ python3 cloud_voip_client.py --server SERVER_IP [--name CLIENT_NAME]
 """
 
 import sys
+import math
 import time
 import threading
+import collections
+import selectors
 import json
 import socket
 import struct
-import argparse
-import uuid
+import ctypes
+import ctypes.util
+import errno
+import atexit
+import random
 import os
 import warnings
 import numpy as np
+from types import SimpleNamespace
 from typing import Dict, Any, Optional, List
 
 # 抑制ALSA警告
@@ -47,6 +54,384 @@ except ImportError:
     AUDIO_AVAILABLE = False
     print("警告: pyaudio未安装，语音功能将不可用")
 
+from audio_dsp_numba import NUMBA_AVAILABLE, noise_gate, echo_finish, vad_features, echo_scores
+from audio_dsp_numba import sum_squares_i16, process_input_frame, volume_q15
+from audio_dsp_numba import warmup as dsp_warmup
+
+# 优先使用scipy.fft（pocketfft，内部缓存FFT计划，支持原地变换），不可用时使用numpy.fft
+try:
+    import scipy.fft as _sp_fft
+    SCIPY_FFT_AVAILABLE = True
+except ImportError:
+    SCIPY_FFT_AVAILABLE = False
+
+# int16与[-1, 1)浮点样本之间的换算系数，使用float32标量，保证运算全程停留在float32
+_INV_I16 = np.float32(1.0 / 32768.0)
+_I16_MAX = np.float32(32767.0)
+# int16平方和换算为[-1, 1)样本能量的系数（2的幂，换算无舍入误差）
+_INV_I16_SQ = 1.0 / (32768.0 * 32768.0)
+
+# 优先使用orjson进行消息编解码（直接输入输出bytes），不可用时回退到标准库json
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+
+    def _dumps_pretty(obj):
+        # 配置文件：2空格缩进，orjson直接输出UTF-8
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+    def _dumps_pretty(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+    def _loads(data):
+        # 标准库json不接受memoryview
+        return json.loads(bytes(data))
+
+# msgpack编码信令消息（VOIP_MSGPACK=1且已安装msgpack时启用），比JSON更小、编解码更快；
+# 接收端按首字节自动识别两种格式（JSON对象以'{'开头，msgpack映射不会），可与旧版服务器混用
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+USE_MSGPACK = MSGPACK_AVAILABLE and os.environ.get('VOIP_MSGPACK') == '1'
+
+
+def _pack_message(message):
+    """序列化一条信令消息"""
+    if USE_MSGPACK:
+        return msgpack.packb(message, use_bin_type=True)
+    return _dumps(message)
+
+
+def _unpack_message(data):
+    """解析一条信令消息，JSON和msgpack均可"""
+    if MSGPACK_AVAILABLE and len(data) and data[0] != 0x7b:
+        return msgpack.unpackb(data, raw=False)
+    return _loads(data)
+
+# 可选的prompt_toolkit交互输入（已安装且在终端中运行时使用）：后台线程打印的通知
+# 显示在提示符上方并自动重绘提示符，不会打乱正在输入的命令
+try:
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.patch_stdout import patch_stdout
+    PROMPT_TOOLKIT_AVAILABLE = True
+except ImportError:
+    PROMPT_TOOLKIT_AVAILABLE = False
+
+# 消息长度前缀（4字节无符号整数，固定小端序，避免依赖主机字节序）
+_LEN = struct.Struct('<I')
+
+
+def _send_framed(sock, data):
+    """
+    发送带长度前缀的消息
+    支持sendmsg的平台上使用分散写，避免拼接包头和消息体；并处理部分写入
+    """
+    header = _LEN.pack(len(data))
+    if hasattr(sock, 'sendmsg'):
+        sent = sock.sendmsg([header, data])
+        # 部分写入时只补发剩余部分，不再拼接整条消息
+        if sent < len(header):
+            sock.sendall(header[sent:])
+            sock.sendall(data)
+        elif sent < len(header) + len(data):
+            sock.sendall(memoryview(data)[sent - len(header):])
+    else:
+        sock.sendall(header + data)
+
+
+# 接收时尽量让内核一次凑满请求的字节数（不支持的平台退化为普通recv）
+_WAITALL = getattr(socket, 'MSG_WAITALL', 0)
+
+
+def _recv_exact_into(sock, buf, n):
+    """读满n字节到buf中，连接关闭时返回False"""
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        got = sock.recv_into(view[pos:n], n - pos, _WAITALL)
+        if not got:
+            return False
+        pos += got
+    return True
+
+
+# 音频批量发送（BATCH_AUDIO=1时启用）：攒够若干帧后用一次sendmmsg系统调用发出，
+# 以增加一帧左右的延迟为代价减少系统调用次数，默认关闭以保证低延迟
+BATCH_AUDIO = os.environ.get('BATCH_AUDIO') == '1'
+
+# 独立网络发送线程（AUDIO_NET_THREAD=1时启用）：音频处理线程只把组好的包放入队列，
+# 由网络线程调用sendto，发送时的系统调用抖动不会拖慢音频处理
+AUDIO_NET_THREAD = os.environ.get('AUDIO_NET_THREAD') == '1'
+
+# 每个UDP包合并的音频帧数（AUDIO_FRAMES_PER_PACKET=N时启用）：减少发包次数和包头开销，
+# 代价是增加N-1帧的延迟；仅在通话双方都声明支持时生效，且整包不超过收发两端4096字节的接收缓冲区
+try:
+    FRAMES_PER_PACKET = max(1, int(os.environ.get('AUDIO_FRAMES_PER_PACKET', '1')))
+except ValueError:
+    FRAMES_PER_PACKET = 1
+
+# 服务器和客户端的音频接收缓冲区大小（单个UDP包的上限）
+AUDIO_MAX_PACKET = 4096
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IoVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+class AudioBatchSender:
+    """
+    通过libc的sendmmsg一次发送多个UDP音频包（仅Linux）
+    每个包仍是独立的数据报，服务器端无需任何改动
+    """
+
+    def __init__(self, sock: socket.socket, addr, packet_size: int, batch_size: int = 2):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._sendmmsg = libc.sendmmsg  # 不支持时抛出AttributeError
+        self._fd = sock.fileno()
+        self.batch_size = batch_size
+        self.count = 0
+        
+        # 目标地址 sockaddr_in
+        ip = socket.gethostbyname(addr[0])
+        raw_addr = (struct.pack('=H', socket.AF_INET) + struct.pack('!H', addr[1])
+                    + socket.inet_aton(ip) + b'\x00' * 8)
+        self._addr = ctypes.create_string_buffer(raw_addr, len(raw_addr))
+        
+        # 每个包一个预分配缓冲区，iovec/mmsghdr预先指向这些缓冲区
+        self._bufs = [bytearray(packet_size) for _ in range(batch_size)]
+        self._mvs = [memoryview(buf) for buf in self._bufs]
+        self._iovs = (_IoVec * batch_size)()
+        self._msgs = (_MMsgHdr * batch_size)()
+        for i, buf in enumerate(self._bufs):
+            c_buf = (ctypes.c_char * packet_size).from_buffer(buf)
+            self._iovs[i].iov_base = ctypes.addressof(c_buf)
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._addr)
+            hdr.msg_namelen = len(raw_addr)
+            hdr.msg_iov = ctypes.pointer(self._iovs[i])
+            hdr.msg_iovlen = 1
+
+    def add(self, packet):
+        """加入一个音频包，攒满一批时发送"""
+        n = len(packet)
+        self._mvs[self.count][:n] = packet
+        self._iovs[self.count].iov_len = n
+        self.count += 1
+        if self.count >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """发送已攒下的音频包"""
+        if not self.count:
+            return
+        count, self.count = self.count, 0
+        if self._sendmmsg(self._fd, self._msgs, count, 0) < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+
+class AudioBatchReceiver:
+    """
+    通过libc的recvmmsg一次取出多个已到达的UDP音频包（仅Linux）
+    在选择器报告可读后以非阻塞方式调用，只取接收队列中已有的包，不会额外等待
+    """
+
+    def __init__(self, sock: socket.socket, packet_size: int = AUDIO_MAX_PACKET, batch_size: int = 8):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._recvmmsg = libc.recvmmsg  # 不支持时抛出AttributeError
+        self._fd = sock.fileno()
+        self.batch_size = batch_size
+        
+        # 每个包一个预分配缓冲区，iovec/mmsghdr预先指向这些缓冲区；不需要来源地址
+        self._bufs = [bytearray(packet_size) for _ in range(batch_size)]
+        self.views = [memoryview(buf) for buf in self._bufs]
+        self._iovs = (_IoVec * batch_size)()
+        self._msgs = (_MMsgHdr * batch_size)()
+        for i, buf in enumerate(self._bufs):
+            c_buf = (ctypes.c_char * packet_size).from_buffer(buf)
+            self._iovs[i].iov_base = ctypes.addressof(c_buf)
+            self._iovs[i].iov_len = packet_size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self._iovs[i])
+            hdr.msg_iovlen = 1
+
+    def recv(self):
+        """取出已到达的音频包，返回包数（暂无数据时为0）；第i个包为views[i]的前length(i)字节"""
+        count = self._recvmmsg(self._fd, self._msgs, self.batch_size, socket.MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return 0
+            raise OSError(err, os.strerror(err))
+        return count
+
+    def length(self, i):
+        """第i个包的字节数"""
+        return self._msgs[i].msg_len
+
+
+class AudioNetSender:
+    """
+    音频发送线程：单生产者（音频处理线程）单消费者（网络线程）的固定槽位环形队列
+
+    每个槽位是预分配的缓冲区，入队只拷贝一次数据；队列满时丢弃新帧，
+    不会覆盖网络线程正在发送的槽位
+    """
+
+    def __init__(self, sock: socket.socket, addr, packet_size: int,
+                 batch: Optional[AudioBatchSender] = None, slots: int = 16):
+        self._sock = sock
+        self._addr = addr
+        self._batch = batch
+        self._slots = [memoryview(bytearray(packet_size)) for _ in range(slots)]
+        self._head = 0
+        self._q = collections.deque()
+        self._event = threading.Event()
+        self._running = True
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, packet):
+        """音频处理线程调用：拷贝数据包到下一个槽位并唤醒网络线程"""
+        # 最多留一个槽位给网络线程正在发送的包
+        if len(self._q) >= len(self._slots) - 1 or len(packet) > len(self._slots[0]):
+            self.dropped += 1
+            return
+        slot = self._slots[self._head]
+        self._head = (self._head + 1) % len(self._slots)
+        n = len(packet)
+        slot[:n] = packet
+        self._q.append(slot[:n])
+        if len(self._q) == 1:
+            self._event.set()
+
+    def _run(self):
+        """网络线程：取出数据包发送，队列为空时等待唤醒"""
+        while self._running:
+            try:
+                packet = self._q.popleft()
+            except IndexError:
+                # 暂无新包时先发出未凑满一批的包，避免音频滞留
+                if self._batch is not None and self._batch.count:
+                    try:
+                        self._batch.flush()
+                    except OSError as e:
+                        print(f"音频发送失败: {e}")
+                # 先清除事件再复查队列，避免丢失唤醒信号
+                self._event.clear()
+                if not self._q:
+                    self._event.wait(timeout=0.5)
+                continue
+            try:
+                if self._batch is not None:
+                    self._batch.add(packet)
+                else:
+                    self._sock.sendto(packet, self._addr)
+            except OSError as e:
+                print(f"音频发送失败: {e}")
+
+    def stop(self):
+        """停止网络线程，未发送的包直接丢弃"""
+        self._running = False
+        self._event.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+
+def _finalize_audio(audio_instance, streams=()):
+    """停止并关闭音频流、释放PortAudio；设备释放可能较慢，由后台线程调用"""
+    for stream in streams:
+        if stream is None:
+            continue
+        try:
+            stream.stop_stream()
+            stream.close()
+        except Exception:
+            pass
+    if audio_instance is not None:
+        try:
+            audio_instance.terminate()
+        except Exception:
+            pass
+
+
+# 尚未完成的后台音频释放线程，进程退出前统一等待（atexit只注册一次，不随重连累积）
+_audio_finalizers = set()
+_audio_finalizers_lock = threading.Lock()
+
+
+def _start_audio_finalizer(audio_instance, streams=()):
+    """在后台线程中释放音频流和PortAudio，返回该线程；完成后自动从待等待集合中移除"""
+    def run():
+        try:
+            _finalize_audio(audio_instance, streams)
+        finally:
+            with _audio_finalizers_lock:
+                _audio_finalizers.discard(thread)
+
+    thread = threading.Thread(target=run, daemon=True)
+    with _audio_finalizers_lock:
+        _audio_finalizers.add(thread)
+    thread.start()
+    return thread
+
+
+def _join_audio_finalizers(timeout=2.0):
+    """进程退出前等待尚未完成的音频释放线程，总共最多等待timeout秒"""
+    deadline = time.monotonic() + timeout
+    with _audio_finalizers_lock:
+        pending = list(_audio_finalizers)
+    for thread in pending:
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+
+atexit.register(_join_audio_finalizers)
+
+
+# 保存配置时是否fsync（VOIP_CONFIG_DURABLE=1时启用），默认只保证原子替换
+CONFIG_DURABLE = os.environ.get('VOIP_CONFIG_DURABLE') == '1'
+
+# 保存配置时是否写成紧凑的单行JSON（VOIP_CONFIG_COMPACT=1时启用），
+# 默认保留缩进格式，方便手工编辑audio_config.json
+CONFIG_COMPACT = os.environ.get('VOIP_CONFIG_COMPACT') == '1'
+
+
+def _write_atomic(path, data):
+    """先写入同目录的临时文件再原子替换，中途失败不会留下被截断的配置文件"""
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if CONFIG_DURABLE:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
 
 def get_config_path(filename):
     """
@@ -64,7 +449,8 @@ def get_config_path(filename):
 
 
 class CloudVoIPClient:
-    def __init__(self, server_ip: str, client_name: str = None, base_port: int = 5060):
+    def __init__(self, server_ip: str, client_name: str = None, base_port: int = 5060,
+                 audio_instance=None):
         """
         初始化云VoIP客户端
         
@@ -72,13 +458,18 @@ class CloudVoIPClient:
             server_ip: 服务器IP地址
             client_name: 客户端名称
             base_port: 服务器基础端口
+            audio_instance: 共享的PyAudio实例（由调用方负责释放），为None时自行创建
         """
         self.server_ip = server_ip
         self.base_port = base_port
+        self._shared_audio = audio_instance
+        self._audio_finalizer = None
         
         # 生成唯一客户端ID
-        self.client_id = str(uuid.uuid4())[:8]
+        self.client_id = os.urandom(4).hex()
         self.client_name = client_name or f"Client_{self.client_id}"
+        # 音频包头中的源ID（16字节，不足补0），整个会话内不变
+        self._src_hdr = self.client_id.encode('utf-8').ljust(16, b'\x00')[:16]
         
         # 连接状态
         self.connected = False
@@ -93,9 +484,16 @@ class CloudVoIPClient:
         self.message_socket = None
         self.audio_socket = None
         self.control_socket = None
+        # 停止音频接收的唤醒通道（socketpair，可与音频套接字一起select）
+        self._shutdown_r = None
+        self._shutdown_w = None
         
         # 线程
         self.message_thread = None
+        self._tx_thread = None
+        self._audio_batch = None
+        self._audio_rx_batch = None
+        self._audio_net = None
         self.audio_receive_thread = None
         self.audio_send_thread = None
         
@@ -103,6 +501,11 @@ class CloudVoIPClient:
         self.online_clients = {}  # {client_id: client_info}
         self.current_call = None  # 当前通话信息
         self.current_room = None  # 当前房间
+        self.pending_calls: Dict[str, Dict[str, Any]] = {}  # {call_id: {caller, timestamp}} 待处理的来电
+        self._time_cache = (None, '')  # (秒级时间戳, 格式化后的时间字符串)
+        self._prompt_session = None  # 交互模式使用的prompt_toolkit会话，未使用时为None
+        self._stdin_sel = None  # 交互模式等待终端输入的选择器（仅POSIX）
+        self._stdin_pending = bytearray()  # 已从终端读出、尚未取走的输入
         
         # 音频配置
         self.audio_format = pyaudio.paInt16 if AUDIO_AVAILABLE else None
@@ -113,6 +516,25 @@ class CloudVoIPClient:
         self.audio_input = None
         self.audio_output = None
         
+        # 预分配的音频发送缓冲区：32字节包头 + 一帧音频数据
+        self._dst_hdr = b'\x00' * 16
+        self._call_hdr = None                # 当前通话的32字节包头，无通话时为None
+        self._audio_addr = None              # 音频服务器地址元组，通话建立时确定
+        self._frames_per_packet = 1          # 本次通话每个UDP包合并的帧数，与对方协商后确定
+        self._tx_frames = []                 # 等待合并发送的已处理帧
+        self._send_buf = bytearray(32)
+        self._send_mv = memoryview(self._send_buf)
+        
+        # 回调模式下的音频帧队列：麦克风回调 -> 发送线程，接收线程 -> 扬声器回调
+        # deque的append/popleft是线程安全的；maxlen满时自动丢弃最旧的帧，适合实时音频
+        self.audio_queue_size = 64
+        # 采集队列单独设小上限：处理线程跟不上时丢弃最旧的帧，把积压延迟限制在约0.5秒（8帧）内
+        self.capture_queue_size = 8
+        self._audio_tx_q = collections.deque(maxlen=self.capture_queue_size)
+        self._audio_rx_q = collections.deque(maxlen=self.audio_queue_size)
+        self._audio_tx_event = threading.Event()  # 仅在队列由空变为非空时唤醒发送线程
+        self._silence_frame = b''
+        
         # 啸叫抑制配置
         self.echo_cancellation = True        # 回声消除
         self.noise_suppression = True        # 噪声抑制
@@ -126,8 +548,15 @@ class CloudVoIPClient:
         self.echo_delay_samples = 1024       # 回声延迟采样数
         
         # 音频缓冲和历史数据
-        self.audio_history = []              # 输出音频历史，用于回声消除
         self.history_size = 5                # 保留历史帧数（减少到5帧）
+        self.audio_history = collections.deque(maxlen=self.history_size)  # 输出音频历史，用于回声消除
+        self._in_f32 = None                  # 发送线程复用的浮点转换缓冲区
+        self._out_i16 = None                 # 发送线程复用的int16输出缓冲区
+        self._rx_i16 = None                  # 接收线程调整输出音量复用的int16缓冲区
+        self._scratch_a = None               # 发送线程复用的浮点临时缓冲区
+        self._scratch_b = None
+        self._ec_out = None                  # 回声抑制输出缓冲区
+        self._rfft_buf = None
         self.silence_counter = 0             # 静音计数器
         self.silence_threshold = 50          # 静音阈值（连续静音帧数）
         
@@ -139,16 +568,47 @@ class CloudVoIPClient:
         
         # 语音增强参数
         self.spectral_subtraction = False    # 谱减法降噪
+        self.spectral_alpha = 1.5            # 谱减法过减因子
+        self.spectral_beta = 0.02            # 谱减法频谱下限（相对原始幅度）
+        self._noise_mag = None               # 静音帧上估计的噪声幅度谱
         self.adaptive_threshold = True       # 自适应阈值
         self.echo_detection_window = 3       # 回声检测窗口（帧数）
+        self.debug_audio_processing = False  # 音频处理调试输出
+        self._audio_config_cache = (None, None)  # (设置元组, 序列化后的配置)，用于save_audio_config
+        self.batch_mode = False              # 批处理模式：发送线程积压多帧时整批做谱减法FFT
+        self.batch_size = 8                  # 批处理最大帧数
+        self.numpy_available = True          # numpy是模块级硬依赖，始终可用
+        
+        # 语音活动检测状态（首帧之前为None/空）
+        self.prev_energy = None              # 上一帧能量
+        self.avg_noise_energy = None         # 自适应阈值的平均噪声能量
+        self.voice_history = collections.deque(maxlen=5)  # 最近5帧的判定结果，用于平滑
         
         # 线程锁
         self.clients_lock = threading.Lock()
         self.call_lock = threading.Lock()
+        
+        # 消息发送队列：所有线程只入队，由唯一的发送线程写套接字，避免消息帧交错
+        self._tx_q = collections.deque()
+        self._tx_ev = threading.Event()
+        self._tx_stop = False
         self.client_list_event = threading.Event()  # 用于客户端列表同步
         
+        # 服务器消息分发表 {msg_type: handler}
+        self._handlers = {
+            'register_response': self.handle_register_response,
+            'broadcast': self.handle_broadcast_message,
+            'private': self.handle_private_message,
+            'call_request': self.handle_call_request,
+            'call_answer': self.handle_call_answer,
+            'call_hangup': self.handle_call_hangup,
+            'client_list': self.handle_client_list,
+            'heartbeat': self._handle_heartbeat,
+        }
+        
         # 加载音频配置
         self.load_audio_config()
+        self._reset_echo_history()
 
     def load_audio_config(self, config_file='audio_config.json'):
         """加载音频配置"""
@@ -173,14 +633,15 @@ class CloudVoIPClient:
                 self.silence_threshold = audio_settings.get('silence_threshold', self.silence_threshold)
                 
                 # 更新新的回声消除参数
-                self.echo_threshold = audio_settings.get('echo_threshold', getattr(self, 'echo_threshold', 0.6))
-                self.echo_suppression_factor = audio_settings.get('echo_suppression_factor', getattr(self, 'echo_suppression_factor', 0.7))
-                self.min_suppression = audio_settings.get('min_suppression', getattr(self, 'min_suppression', 0.3))
-                self.echo_learning_rate = audio_settings.get('echo_learning_rate', getattr(self, 'echo_learning_rate', 0.1))
-                self.spectral_subtraction = audio_settings.get('spectral_subtraction', getattr(self, 'spectral_subtraction', False))
-                self.adaptive_threshold = audio_settings.get('adaptive_threshold', getattr(self, 'adaptive_threshold', True))
-                self.echo_detection_window = audio_settings.get('echo_detection_window', getattr(self, 'echo_detection_window', 3))
+                self.echo_threshold = audio_settings.get('echo_threshold', self.echo_threshold)
+                self.echo_suppression_factor = audio_settings.get('echo_suppression_factor', self.echo_suppression_factor)
+                self.min_suppression = audio_settings.get('min_suppression', self.min_suppression)
+                self.echo_learning_rate = audio_settings.get('echo_learning_rate', self.echo_learning_rate)
+                self.spectral_subtraction = audio_settings.get('spectral_subtraction', self.spectral_subtraction)
+                self.adaptive_threshold = audio_settings.get('adaptive_threshold', self.adaptive_threshold)
+                self.echo_detection_window = audio_settings.get('echo_detection_window', self.echo_detection_window)
                 self.debug_audio_processing = audio_settings.get('debug_audio_processing', False)
+                self.batch_mode = audio_settings.get('batch_mode', self.batch_mode)
                 
                 # 高级设置
                 advanced_settings = config.get('advanced_settings', {})
@@ -199,6 +660,8 @@ class CloudVoIPClient:
                 
         except Exception as e:
             print(f"❌ 加载音频配置失败: {e}，使用默认配置")
+        
+        self._build_input_pipeline()
 
     def _create_default_audio_config(self, config_path):
         """创建默认的音频配置文件"""
@@ -214,14 +677,15 @@ class CloudVoIPClient:
                 "echo_delay_samples": self.echo_delay_samples,
                 "history_size": self.history_size,
                 "silence_threshold": self.silence_threshold,
-                "echo_threshold": getattr(self, 'echo_threshold', 0.6),
-                "echo_suppression_factor": getattr(self, 'echo_suppression_factor', 0.7),
-                "min_suppression": getattr(self, 'min_suppression', 0.3),
-                "echo_learning_rate": getattr(self, 'echo_learning_rate', 0.1),
-                "spectral_subtraction": getattr(self, 'spectral_subtraction', False),
-                "adaptive_threshold": getattr(self, 'adaptive_threshold', True),
-                "echo_detection_window": getattr(self, 'echo_detection_window', 3),
-                "debug_audio_processing": False
+                "echo_threshold": self.echo_threshold,
+                "echo_suppression_factor": self.echo_suppression_factor,
+                "min_suppression": self.min_suppression,
+                "echo_learning_rate": self.echo_learning_rate,
+                "spectral_subtraction": self.spectral_subtraction,
+                "adaptive_threshold": self.adaptive_threshold,
+                "echo_detection_window": self.echo_detection_window,
+                "debug_audio_processing": False,
+                "batch_mode": self.batch_mode
             },
             "advanced_settings": {
                 "chunk_size": self.chunk,
@@ -243,7 +707,8 @@ class CloudVoIPClient:
                 "echo_suppression_factor": "回声抑制强度 - 越高抑制越强 (推荐0.5-0.8)",
                 "min_suppression": "最小抑制比例 - 避免完全静音 (推荐0.2-0.4)",
                 "adaptive_threshold": "自适应阈值 - 根据环境自动调整检测阈值",
-                "debug_audio_processing": "调试模式 - 显示详细的音频处理信息"
+                "debug_audio_processing": "调试模式 - 显示详细的音频处理信息",
+                "batch_mode": "批处理模式 - 发送积压时整批处理谱减法降噪，减少逐帧调用开销"
             },
             "troubleshooting": {
                 "no_sound_after_echo_cancellation": {
@@ -289,7 +754,17 @@ class CloudVoIPClient:
         try:
             # 连接消息服务
             self.message_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # 缓冲区需在connect之前设置才能影响TCP窗口协商
+            self.message_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 256 * 1024)
+            self.message_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 256 * 1024)
             self.message_socket.connect((self.server_ip, self.message_port))
+            # 关闭Nagle算法，信令消息都很小，避免每次发送额外等待约40ms
+            self.message_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            
+            # 消息接收缓冲区（单条消息最大1MB）
+            self._msg_rx_buf = bytearray(1 << 20)
+            self._msg_rx_mv = memoryview(self._msg_rx_buf)
+            self._msg_hdr_buf = bytearray(_LEN.size)
             
             # 设置连接状态
             self.connected = True
@@ -299,6 +774,12 @@ class CloudVoIPClient:
             self.message_thread.daemon = True
             self.message_thread.start()
             
+            # 启动消息发送线程
+            self._tx_stop = False
+            self._tx_thread = threading.Thread(target=self.message_send_thread)
+            self._tx_thread.daemon = True
+            self._tx_thread.start()
+            
             # 初始化音频（如果可用）
             audio_port = None
             if AUDIO_AVAILABLE:
@@ -334,14 +815,28 @@ class CloudVoIPClient:
             return False
         
         try:
-            self.audio_instance = pyaudio.PyAudio()
+            # 重连时复用调用方共享的PyAudio实例，避免重复初始化PortAudio
+            self.audio_instance = self._shared_audio if self._shared_audio is not None else pyaudio.PyAudio()
             
             # 连接音频服务
             self.audio_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # 发送缓冲区至少容纳几十帧音频，避免突发时丢包
+            self.audio_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 64 * 1024)
+            # 接收缓冲区加大，多方通话时的突发音频不至于在内核中丢弃
+            self.audio_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            # 标记DSCP EF（加速转发），支持QoS的网络会优先转发语音包
+            try:
+                self.audio_socket.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, 0xb8)
+            except (AttributeError, OSError):
+                pass
             # 绑定到本地任意可用端口
             self.audio_socket.bind(('0.0.0.0', 0))
             local_audio_port = self.audio_socket.getsockname()[1]
             
+            # 停止音频流时写入一个字节，唤醒阻塞在select上的接收线程
+            self._shutdown_r, self._shutdown_w = socket.socketpair()
+            self._shutdown_r.setblocking(False)
+            
             print(f"🎵 音频系统已初始化，本地音频端口: {local_audio_port}")
             return True
             
@@ -356,47 +851,58 @@ class CloudVoIPClient:
         
         try:
             # 添加客户端ID
-            if 'client_id' not in message:
-                message['client_id'] = self.client_id
+            message.setdefault('client_id', self.client_id)
             
-            data = json.dumps(message).encode('utf-8')
-            length = struct.pack('I', len(data))
-            self.message_socket.send(length + data)
+            data = _pack_message(message)
+            self._tx_q.append(data)
+            self._tx_ev.set()
             return True
             
         except Exception as e:
             print(f"发送消息失败: {e}")
             return False
 
+    def message_send_thread(self):
+        """消息发送线程，唯一写入消息套接字的线程"""
+        while True:
+            self._tx_ev.wait()
+            self._tx_ev.clear()
+            self._flush_tx_queue()
+            if self._tx_stop:
+                # 停止标志在所有消息入队之后设置，再发送一次确保不遗漏
+                self._flush_tx_queue()
+                break
+
+    def _flush_tx_queue(self):
+        """发送队列中所有待发送的消息"""
+        while self._tx_q:
+            data = self._tx_q.popleft()
+            try:
+                _send_framed(self.message_socket, data)
+            except Exception as e:
+                print(f"发送消息失败: {e}")
+
     def message_receive_thread(self):
         """消息接收线程"""
         while self.running and self.connected:
             try:
-                # 接收消息长度
-                length_data = self.message_socket.recv(4)
-                if not length_data:
+                # 接收消息长度（读满4字节，避免短读导致解析错位）
+                if not _recv_exact_into(self.message_socket, self._msg_hdr_buf, _LEN.size):
                     break
                 
-                msg_length = struct.unpack('I', length_data)[0]
-                if msg_length > 1024 * 1024:  # 1MB限制
+                msg_length = _LEN.unpack_from(self._msg_hdr_buf)[0]
+                if msg_length > len(self._msg_rx_buf):  # 1MB限制
                     break
                 
-                # 接收完整消息
-                data = b''
-                while len(data) < msg_length:
-                    chunk = self.message_socket.recv(min(msg_length - len(data), 4096))
-                    if not chunk:
-                        break
-                    data += chunk
-                
-                if len(data) != msg_length:
+                # 接收完整消息，直接写入预分配的缓冲区
+                if not _recv_exact_into(self.message_socket, self._msg_rx_mv, msg_length):
                     break
                 
-                # 解析并处理消息
+                # 解析并处理消息（处理完成前不会复用缓冲区）
                 try:
-                    message = json.loads(data.decode('utf-8'))
+                    message = _unpack_message(self._msg_rx_mv[:msg_length])
                     self.handle_server_message(message)
-                except json.JSONDecodeError as e:
+                except ValueError as e:  # JSON和msgpack的解析错误都是ValueError子类
                     pass
                     
             except Exception as e:
@@ -406,30 +912,20 @@ class CloudVoIPClient:
         
         self.connected = False
         print("与服务器的连接已断开")
+        self._interrupt_prompt()
 
     def handle_server_message(self, message: Dict[str, Any]):
         """处理服务器消息"""
         msg_type = message.get('type', 'unknown')
-        
-        if msg_type == 'register_response':
-            self.handle_register_response(message)
-        elif msg_type == 'broadcast':
-            self.handle_broadcast_message(message)
-        elif msg_type == 'private':
-            self.handle_private_message(message)
-        elif msg_type == 'call_request':
-            self.handle_call_request(message)
-        elif msg_type == 'call_answer':
-            self.handle_call_answer(message)
-        elif msg_type == 'call_hangup':
-            self.handle_call_hangup(message)
-        elif msg_type == 'client_list':
-            self.handle_client_list(message)
-        elif msg_type == 'heartbeat':
-            # 心跳消息，静默处理
-            pass
-        else:
-            print(f"收到未知消息类型: {msg_type}")
+        self._handlers.get(msg_type, self._handle_unknown)(message)
+
+    def _handle_heartbeat(self, message: Dict[str, Any]):
+        """心跳消息，静默处理"""
+        pass
+
+    def _handle_unknown(self, message: Dict[str, Any]):
+        """处理未知类型的消息"""
+        print(f"收到未知消息类型: {message.get('type', 'unknown')}")
 
     def handle_register_response(self, message: Dict[str, Any]):
         """处理注册响应"""
@@ -441,15 +937,24 @@ class CloudVoIPClient:
         else:
             print("❌ 注册失败")
 
+    def _format_time(self, timestamp: float) -> str:
+        """格式化消息时间 HH:MM:SS，同一秒内的消息复用上次的格式化结果"""
+        sec = int(timestamp)
+        cached_sec, cached_str = self._time_cache
+        if sec != cached_sec:
+            cached_str = time.strftime("%H:%M:%S", time.localtime(sec))
+            self._time_cache = (sec, cached_str)
+        return cached_str
+
     def handle_broadcast_message(self, message: Dict[str, Any]):
         """处理广播消息"""
         sender = message.get('from', 'unknown')
         content = message.get('content', '')
         timestamp = message.get('timestamp', time.time())
         
-        time_str = time.strftime("%H:%M:%S", time.localtime(timestamp))
+        time_str = self._format_time(timestamp)
         print(f"\n📢 [广播] {sender} ({time_str}): {content}")
-        print(f"{self.client_name}> ", end="", flush=True)
+        self._reprint_prompt()
 
     def handle_private_message(self, message: Dict[str, Any]):
         """处理私聊消息"""
@@ -457,9 +962,9 @@ class CloudVoIPClient:
         content = message.get('content', '')
         timestamp = message.get('timestamp', time.time())
         
-        time_str = time.strftime("%H:%M:%S", time.localtime(timestamp))
+        time_str = self._format_time(timestamp)
         print(f"\n💬 [私聊] {sender} ({time_str}): {content}")
-        print(f"{self.client_name}> ", end="", flush=True)
+        self._reprint_prompt()
 
     def handle_call_request(self, message: Dict[str, Any]):
         """处理通话请求"""
@@ -469,11 +974,9 @@ class CloudVoIPClient:
         print(f"\n📞 收到来自 {caller} 的通话请求 (通话ID: {call_id})")
         
         # 存储待处理的通话请求
-        if not hasattr(self, 'pending_calls'):
-            self.pending_calls = {}
-        
         self.pending_calls[call_id] = {
             'caller': caller,
+            'multi_frame': message.get('multi_frame', False),
             'timestamp': time.time()
         }
         
@@ -488,17 +991,18 @@ class CloudVoIPClient:
         
         if accepted:
             print(f"✅ {responder} 接受了您的通话请求")
-            print(f"{self.client_name}> ", end="", flush=True)
+            self._reprint_prompt()
             with self.call_lock:
                 self.current_call = {
                     'id': call_id,
                     'peer': responder,
                     'status': 'active'
                 }
+                self._prepare_call_frame(responder, message.get('multi_frame', False))
             self.start_audio_streams()
         else:
             print(f"❌ {responder} 拒绝了您的通话请求")
-            print(f"{self.client_name}> ", end="", flush=True)
+            self._reprint_prompt()
 
     def handle_call_hangup(self, message: Dict[str, Any]):
         """处理挂断通话"""
@@ -506,33 +1010,29 @@ class CloudVoIPClient:
         peer = message.get('from')
         
         print(f"📞 {peer} 挂断了通话")
-        print(f"{self.client_name}> ", end="", flush=True)
+        self._reprint_prompt()
         
         with self.call_lock:
             self.current_call = None
+            self._clear_call_frame()
         
         self.stop_audio_streams()
 
     def show_call_options(self, call_id: str, caller: str):
         """显示通话选项界面"""
-        # 自动接听模式，无需用户输入
-        def handle_call_input():
-            print(f"\n{'='*50}")
-            print(f"📞 来自 {caller} 的通话请求")
-            print(f"通话ID: {call_id}")
-            print(f"{'='*50}")
-            print("🤖 自动接听模式: 正在自动接受通话...")
-            print(f"{'='*50}")
-            
-            # 自动接受通话
-            if call_id in getattr(self, 'pending_calls', {}):
-                self.accept_call(call_id)
-            else:
-                print(f"❌ 通话ID {call_id} 不存在")
+        # 自动接听模式，无需用户输入，直接在消息线程中接听
+        print(f"\n{'='*50}")
+        print(f"📞 来自 {caller} 的通话请求")
+        print(f"通话ID: {call_id}")
+        print(f"{'='*50}")
+        print("🤖 自动接听模式: 正在自动接受通话...")
+        print(f"{'='*50}")
         
-        # 在单独线程中处理
-        input_thread = threading.Thread(target=handle_call_input, daemon=True)
-        input_thread.start()
+        # 自动接受通话
+        if call_id in self.pending_calls:
+            self.accept_call(call_id)
+        else:
+            print(f"❌ 通话ID {call_id} 不存在")
 
     def handle_client_list(self, message: Dict[str, Any]):
         """处理客户端列表"""
@@ -549,7 +1049,7 @@ class CloudVoIPClient:
         # 设置事件，通知show_clients函数
         self.client_list_event.set()
         print(f"✅ 客户端列表更新完成")
-        print(f"{self.client_name}> ", end="", flush=True)
+        self._reprint_prompt()
 
     def request_client_list(self):
         """请求客户端列表"""
@@ -588,6 +1088,7 @@ class CloudVoIPClient:
         message = {
             'type': 'call_request',
             'target': target_id,
+            'multi_frame': True,  # 本客户端能接收多帧合并的音频包
             'timestamp': time.time()
         }
         
@@ -598,9 +1099,6 @@ class CloudVoIPClient:
 
     def accept_call(self, call_id: str):
         """接受通话"""
-        if not hasattr(self, 'pending_calls'):
-            self.pending_calls = {}
-        
         if call_id not in self.pending_calls:
             print(f"❌ 未找到通话ID: {call_id}")
             return False
@@ -612,6 +1110,7 @@ class CloudVoIPClient:
             'type': 'call_answer',
             'call_id': call_id,
             'accepted': True,
+            'multi_frame': True,  # 本客户端能接收多帧合并的音频包
             'timestamp': time.time()
         }
         
@@ -622,6 +1121,7 @@ class CloudVoIPClient:
                     'peer': caller,
                     'status': 'active'
                 }
+                self._prepare_call_frame(caller, self.pending_calls[call_id]['multi_frame'])
             print(f"✅ 已接受来自 {caller} 的通话")
             self.start_audio_streams()
             
@@ -632,9 +1132,6 @@ class CloudVoIPClient:
 
     def reject_call(self, call_id: str):
         """拒绝通话"""
-        if not hasattr(self, 'pending_calls'):
-            self.pending_calls = {}
-        
         if call_id not in self.pending_calls:
             print(f"❌ 未找到通话ID: {call_id}")
             return False
@@ -657,8 +1154,12 @@ class CloudVoIPClient:
             return True
         return False
 
-    def hangup_call(self):
-        """挂断当前通话"""
+    def hangup_call(self, stop_streams=True):
+        """
+        挂断当前通话
+        
+        stop_streams为False时不在此处停止音频流，由调用方处理（断开连接时交给后台线程）
+        """
         with self.call_lock:
             if not self.current_call:
                 print("❌ 当前没有进行中的通话")
@@ -666,6 +1167,7 @@ class CloudVoIPClient:
             
             call_id = self.current_call['id']
             self.current_call = None
+            self._clear_call_frame()
         
         message = {
             'type': 'call_hangup',
@@ -674,7 +1176,8 @@ class CloudVoIPClient:
         }
         
         self.send_message(message)
-        self.stop_audio_streams()
+        if stop_streams:
+            self.stop_audio_streams()
         print("📞 通话已结束")
         return True
 
@@ -685,7 +1188,13 @@ class CloudVoIPClient:
             return
         
         try:
-            # 启动音频输入流（麦克风）- 添加更多配置以减少延迟
+            # 清空音频帧队列（回调在start_stream之后才会被调用）
+            self._audio_tx_q.clear()
+            self._audio_rx_q.clear()
+            self._audio_tx_event.clear()
+            self._silence_frame = b'\x00' * (self.chunk * 2 * self.channels)
+            
+            # 启动音频输入流（麦克风）- 回调模式，由PortAudio线程直接投递数据
             self.audio_input = self.audio_instance.open(
                 format=self.audio_format,
                 channels=self.channels,
@@ -693,12 +1202,11 @@ class CloudVoIPClient:
                 input=True,
                 frames_per_buffer=self.chunk,
                 input_device_index=None,  # 使用默认输入设备
-                # 添加低延迟配置
-                stream_callback=None,
+                stream_callback=self._mic_cb,
                 start=False
             )
             
-            # 启动音频输出流（扬声器）- 添加更多配置以减少延迟
+            # 启动音频输出流（扬声器）- 回调模式，从接收队列取数据播放
             self.audio_output = self.audio_instance.open(
                 format=self.audio_format,
                 channels=self.channels,
@@ -706,8 +1214,7 @@ class CloudVoIPClient:
                 output=True,
                 frames_per_buffer=self.chunk,
                 output_device_index=None,  # 使用默认输出设备
-                # 添加低延迟配置
-                stream_callback=None,
+                stream_callback=self._spk_cb,
                 start=False
             )
             
@@ -715,9 +1222,50 @@ class CloudVoIPClient:
             self.audio_processing_init()
             
             # 清除音频历史
-            self.audio_history = []
+            self.clear_echo_history()
             self.silence_counter = 0
             
+            # 预分配接收缓冲区，避免每个UDP包分配新的bytes对象
+            self._recv_buf = bytearray(AUDIO_MAX_PACKET)
+            self._recv_mv = memoryview(self._recv_buf)
+            
+            # 批量接收器：每次唤醒取出所有已到达的包，不支持recvmmsg的平台退回逐包接收
+            self._audio_rx_batch = None
+            try:
+                self._audio_rx_batch = AudioBatchReceiver(self.audio_socket)
+            except (OSError, AttributeError):
+                pass
+            
+            # 可选的批量发送器，不支持sendmmsg的平台退回逐包发送
+            self._audio_batch = None
+            if BATCH_AUDIO:
+                try:
+                    self._audio_batch = AudioBatchSender(
+                        self.audio_socket, (self.server_ip, self.audio_port),
+                        32 + self._max_payload())
+                    print("📦 音频批量发送: 启用")
+                except (OSError, AttributeError) as e:
+                    print(f"音频批量发送不可用，使用逐包发送: {e}")
+            
+            # 可选的独立网络发送线程，批量发送器此时归网络线程使用
+            if self._audio_net is not None:
+                self._audio_net.stop()
+            self._audio_net = None
+            if AUDIO_NET_THREAD:
+                self._audio_net = AudioNetSender(
+                    self.audio_socket, (self.server_ip, self.audio_port),
+                    32 + self._max_payload(), self._audio_batch)
+                print("🧵 独立音频发送线程: 启用")
+            if self._frames_per_packet > 1:
+                print(f"📦 每包合并音频帧数: {self._frames_per_packet}")
+            
+            # 丢弃上一次通话遗留的唤醒信号
+            try:
+                while self._shutdown_r.recv(64):
+                    pass
+            except (BlockingIOError, AttributeError):
+                pass
+            
             # 启动音频流
             self.audio_input.start_stream()
             self.audio_output.start_stream()
@@ -744,6 +1292,36 @@ class CloudVoIPClient:
         except Exception as e:
             print(f"启动音频流失败: {e}")
 
+    def _prepare_call_frame(self, peer: str, peer_multi_frame: bool = False):
+        """
+        通话建立时预先构造音频包头（源ID + 目标ID）和发送缓冲区，整个通话期间不变
+        
+        peer_multi_frame为对方是否声明能接收多帧合并的音频包，决定本次通话每包合并的帧数
+        """
+        frame_bytes = self.chunk * 2 * self.channels
+        self._frames_per_packet = 1
+        if peer_multi_frame and FRAMES_PER_PACKET > 1:
+            # 合并包：1字节帧数 + N帧音频，整包不超过接收缓冲区
+            self._frames_per_packet = max(1, min(FRAMES_PER_PACKET, (AUDIO_MAX_PACKET - 33) // frame_bytes))
+        self._tx_frames = []
+        self._dst_hdr = peer.encode('utf-8').ljust(16, b'\x00')[:16]
+        self._send_buf = bytearray(32 + self._max_payload())
+        self._send_buf[:32] = self._src_hdr + self._dst_hdr
+        self._send_mv = memoryview(self._send_buf)
+        self._call_hdr = self._src_hdr + self._dst_hdr
+        self._audio_addr = (self.server_ip, self.audio_port)
+
+    def _max_payload(self):
+        """本次通话单个音频包的最大负载字节数"""
+        frame_bytes = self.chunk * 2 * self.channels
+        if self._frames_per_packet > 1:
+            return 1 + self._frames_per_packet * frame_bytes
+        return frame_bytes
+
+    def _clear_call_frame(self):
+        """通话结束时清除预构造的包头"""
+        self._call_hdr = None
+
     def stop_audio_streams(self):
         """停止音频流"""
         try:
@@ -761,212 +1339,380 @@ class CloudVoIPClient:
             
         except Exception as e:
             print(f"停止音频流错误: {e}")
+        finally:
+            self._wake_audio_threads()
+
+    def _wake_audio_threads(self):
+        """唤醒发送线程和接收线程，使其检查通话状态后退出"""
+        self._audio_tx_event.set()
+        if self._audio_net is not None:
+            self._audio_net.stop()
+            self._audio_net = None
+        if self._shutdown_w:
+            try:
+                self._shutdown_w.send(b'\x00')
+            except OSError:
+                pass
+
+    def _mic_cb(self, in_data, frame_count, time_info, status):
+        """麦克风回调（PortAudio线程）：只把音频帧放入发送队列"""
+        # in_data是PyAudio为本次回调新建的bytes，队列只保存引用，不做拷贝；
+        # 若改用预分配的环形缓冲区反而要多一次拷贝，发送线程直接在该对象上做处理
+        self._audio_tx_q.append(in_data)
+        if len(self._audio_tx_q) == 1:
+            self._audio_tx_event.set()
+        return (None, pyaudio.paContinue)
+
+    def _spk_cb(self, in_data, frame_count, time_info, status):
+        """扬声器回调（PortAudio线程）：从接收队列取出下一帧，没有数据时播放静音"""
+        needed = frame_count * 2 * self.channels
+        try:
+            data = self._audio_rx_q.popleft()
+        except IndexError:
+            data = self._silence_frame
+        # 返回的数据必须正好是frame_count帧，否则PortAudio会结束流
+        if len(data) != needed:
+            data = data[:needed].ljust(needed, b'\x00')
+        return (data, pyaudio.paContinue)
 
     def audio_processing_init(self):
         """初始化音频处理参数"""
-        try:
-            # 检查numpy是否可用
-            global np
-            if 'np' not in globals():
-                import numpy as np
-        except ImportError:
-            print("警告: numpy未安装，高级音频处理功能将受限")
-            return False
+        # 每帧复用的转换缓冲区，只在发送线程的音频处理中使用
+        self._in_f32 = np.empty(self.chunk, dtype=np.float32)
+        self._out_i16 = np.empty(self.chunk, dtype=np.int16)
+        self._rx_i16 = np.empty(self.chunk, dtype=np.int16)  # 接收线程专用，与发送线程互不共享
+        self._scratch_a = np.empty(self.chunk, dtype=np.float32)
+        self._scratch_b = np.empty(self.chunk, dtype=np.float32)
+        self._ec_out = np.empty(self.chunk, dtype=np.float32)
+        self._rfft_buf = np.empty(self.chunk, dtype=np.float32)  # 谱减法FFT输入缓冲区，可被原地覆盖
+        
+        if NUMBA_AVAILABLE:
+            # 预先触发JIT编译，避免第一帧音频处理时卡顿
+            try:
+                dsp_warmup(self.chunk)
+            except Exception as e:
+                print(f"音频处理内核预热失败: {e}")
         return True
 
+    @staticmethod
+    def _load_f32(buf, audio_data, scale=_INV_I16):
+        """int16字节乘以scale转换为float32，帧长与buf一致时直接写入buf，否则新分配"""
+        i16 = np.frombuffer(audio_data, dtype=np.int16)
+        if buf is None or i16.shape[0] != buf.shape[0]:
+            return i16 * np.float32(scale)
+        np.multiply(i16, np.float32(scale), out=buf)
+        return buf
+
+    @staticmethod
+    def _i16_buffer(buf, n):
+        """取预分配缓冲区buf的前n个元素作为int16输出，buf不存在或不够大时才新分配"""
+        if buf is None or buf.shape[0] < n:
+            return np.empty(n, dtype=np.int16)
+        return buf[:n]
+
+    def _to_float32(self, audio_data):
+        """int16字节转换为[-1, 1)的float32样本，帧长与chunk一致时直接写入预分配缓冲区"""
+        return self._load_f32(self._in_f32, audio_data)
+
+    def _store_int16(self, samples):
+        """已在int16范围内的浮点样本截断为int16字节，帧长一致时复用输出缓冲区"""
+        out = self._out_i16
+        if out is None or samples.shape[0] != out.shape[0]:
+            return samples.astype(np.int16).tobytes()
+        out[:] = samples
+        return out.tobytes()
+
+    def _to_int16_bytes(self, samples):
+        """[-1, 1)的浮点样本限幅后转换回int16字节（会原地修改samples）"""
+        np.multiply(samples, _I16_MAX, out=samples)
+        np.clip(samples, -_I16_MAX, _I16_MAX, out=samples)
+        return self._store_int16(samples)
+
     def apply_noise_gate(self, audio_data):
         """应用噪声门，抑制低于阈值的信号"""
-        if not hasattr(self, 'numpy_available'):
-            self.numpy_available = self.audio_processing_init()
-        
-        if not self.numpy_available:
-            return audio_data
-        
         try:
-            # 将字节数据转换为numpy数组
-            samples = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
-            
-            # 计算RMS音量
-            rms = np.sqrt(np.mean(samples**2))
+            if NUMBA_AVAILABLE:
+                samples = np.frombuffer(audio_data, dtype=np.int16)
+                out = self._i16_buffer(self._out_i16, samples.shape[0])
+                if noise_gate(samples, self.noise_gate_threshold, out):
+                    self.silence_counter += 1
+                else:
+                    self.silence_counter = 0
+                return out.tobytes()
             
-            # 如果音量低于阈值，则静音
-            if rms < self.noise_gate_threshold:
-                samples = samples * 0.1  # 大幅衰减而不是完全静音
-                self.silence_counter += 1
-            else:
-                self.silence_counter = 0
+            # 将字节数据转换为numpy数组
+            samples = self._to_float32(audio_data)
+            self._noise_gate_f32(samples)
             
             # 转换回字节数据
-            return (samples * 32767).astype(np.int16).tobytes()
+            return self._to_int16_bytes(samples)
             
         except Exception as e:
             # 如果处理失败，返回原始数据
             return audio_data
 
+    def _noise_gate_f32(self, samples):
+        """噪声门的浮点实现，原地修改samples"""
+        if samples.size == 0:
+            return samples
+        
+        # 峰值低于阈值时RMS必然也低于阈值，只需一次极值判断，省去能量计算
+        threshold = self.noise_gate_threshold
+        is_quiet = samples.max() < threshold and samples.min() > -threshold
+        
+        # 如果音量低于阈值，则静音（RMS仅在峰值超过阈值时计算）
+        if is_quiet or math.sqrt(float(samples @ samples) / samples.size) < threshold:
+            samples *= np.float32(0.1)  # 大幅衰减而不是完全静音
+            self.silence_counter += 1
+        else:
+            self.silence_counter = 0
+        return samples
+
     def apply_echo_cancellation(self, input_audio, reference_audio=None):
         """智能回声消除 - 改进版本"""
-        if not hasattr(self, 'numpy_available'):
-            self.numpy_available = self.audio_processing_init()
-        
-        if not self.numpy_available or not reference_audio or len(self.audio_history) == 0:
+        if not reference_audio or len(self.audio_history) == 0:
             return input_audio
         
         try:
             # 将音频数据转换为numpy数组
-            input_samples = np.frombuffer(input_audio, dtype=np.int16).astype(np.float32) / 32768.0
-            
-            # 初始化回声检测变量
-            echo_detected = False
-            suppression_factor = 1.0
-            
-            # 多帧回声检测
-            correlation_scores = []
-            
-            # 检查最近几帧的相关性
-            check_frames = min(len(self.audio_history), self.echo_detection_window)
-            
-            for i in range(check_frames):
-                ref_samples = np.frombuffer(self.audio_history[-(i+1)], dtype=np.int16).astype(np.float32) / 32768.0
-                
-                if len(input_samples) == len(ref_samples):
-                    # 检查数据有效性，避免除零警告
-                    input_std = np.std(input_samples)
-                    ref_std = np.std(ref_samples)
-                    
-                    # 只有在两个信号都有足够的变化时才计算相关性
-                    if input_std > 1e-8 and ref_std > 1e-8:
-                        # 计算互相关
-                        correlation = np.corrcoef(input_samples, ref_samples)[0, 1]
-                        if not np.isnan(correlation):
-                            correlation_scores.append(abs(correlation))
-            
-            # 如果有有效的相关性分数
-            if correlation_scores:
-                max_correlation = max(correlation_scores)
-                avg_correlation = np.mean(correlation_scores)
-                
-                # 更智能的回声检测逻辑
-                input_energy = np.sum(input_samples**2)
-                
-                # 只有在输入能量足够且相关性很高时才认为是回声
-                if (max_correlation > self.echo_threshold and 
-                    avg_correlation > 0.4 and 
-                    input_energy > 0.001):  # 确保有足够的信号能量
-                    
-                    echo_detected = True
-                    
-                    # 动态计算抑制因子
-                    # 相关性越高，抑制越强，但保留最小比例
-                    base_suppression = max_correlation * self.echo_suppression_factor
-                    suppression_factor = max(self.min_suppression, 1.0 - base_suppression)
-                    
-                    # 频率域处理（如果启用谱减法）
-                    if self.spectral_subtraction:
-                        suppression_factor = self.apply_spectral_subtraction(
-                            input_samples, ref_samples, suppression_factor)
-            
-            # 应用抑制
-            if echo_detected:
-                # 渐进式抑制，避免突然的音量变化
-                output_samples = input_samples * suppression_factor
-                
-                # 保留一些原始信号特征，避免完全静音
-                if suppression_factor < 0.5:
-                    # 加入少量原始信号，保持语音自然度
-                    output_samples = output_samples * 0.8 + input_samples * 0.2
-            else:
-                output_samples = input_samples
+            input_samples = self._to_float32(input_audio)
             
             # 转换回字节数据
-            return (np.clip(output_samples * 32767, -32767, 32767)).astype(np.int16).tobytes()
+            return self._to_int16_bytes(self._echo_suppress_f32(input_samples))
             
         except Exception as e:
             # 如果处理失败，返回原始数据
             return input_audio
 
+    def _echo_suppress_f32(self, input_samples):
+        """
+        回声检测与抑制的浮点实现
+        
+        未检测到回声时原样返回input_samples；检测到时返回新数组，input_samples保持不变
+        """
+        # 输入峰值过低时能量不可能超过回声判定门限（0.001），直接跳过相关性计算
+        n = len(input_samples)
+        if n == 0:
+            return input_samples
+        peak = max(float(input_samples.max()), -float(input_samples.min()))
+        if peak * peak * n <= 0.001:
+            return input_samples
+        
+        # 初始化回声检测变量
+        echo_detected = False
+        suppression_factor = 1.0
+        
+        # 多帧回声检测
+        corr_count = 0
+        
+        # 检查最近几帧的相关性
+        check_frames = min(len(self.audio_history), self.echo_detection_window)
+        
+        # 输入信号的均值、去均值结果和范数与参考帧无关，只计算一次
+        input_mean = float(input_samples.mean())
+        input_centered = np.subtract(input_samples, input_mean, out=self._scratch_a) \
+            if self._scratch_a is not None and self._scratch_a.shape[0] == n else input_samples - input_mean
+        input_ss = float(input_centered @ input_centered)
+        input_norm = math.sqrt(input_ss)
+        min_norm = 1e-8 * math.sqrt(n)  # 对应标准差1e-8
+        
+        # 最近check_frames帧参考信号在环形缓冲区中是连续的行
+        size = len(self._hist_norm) // 2
+        check_frames = min(check_frames, size)
+        end = self._hist_pos + size
+        window_norm = self._hist_norm[end - check_frames:end]
+        ref_samples = self._hist_f[end - check_frames]  # 窗口内最早的一帧，供谱减法使用
+        
+        # 只有在两个信号都有足够的变化时才计算相关性，避免除零
+        if n == self.chunk and input_norm > min_norm:
+            valid = window_norm > min_norm
+            corr_count = int(np.count_nonzero(valid))
+            if corr_count:
+                # 频域互相关：输入只做一次rfft，与各参考帧频谱（写入历史时已算好）共轭相乘后逆变换，
+                # 一次得到所有延迟下的相关值，回声与参考信号不对齐时也能检测到
+                input_F = np.fft.rfft(input_centered, n=2 * n)
+                window_F = self._hist_F[end - check_frames:end][valid]
+                # numpy 1.x的irfft总是返回float64，转为float32以匹配内核（含AOT模块）的导出签名
+                xcorr = np.fft.irfft(np.conj(window_F) * input_F, n=2 * n, axis=-1).astype(np.float32, copy=False)
+                # 只看输入滞后于参考信号的延迟（回声总是晚于扬声器输出），最大延迟由echo_delay_samples限定
+                max_lag = max(0, min(int(self.echo_delay_samples), n - 1))
+                # 阈值是按单一延迟的相关系数整定的，所有延迟取最大值会让不相关的低频信号也常常超过阈值，
+                # 因此评分只取跟踪到的延迟处的值，各延迟的峰值只用于更新延迟估计
+                lag = min(self._echo_lag, max_lag)
+                norms = window_norm[valid]
+                if NUMBA_AVAILABLE:
+                    max_correlation, corr_sum, peak_lag, peak_score = echo_scores(
+                        xcorr, lag, max_lag, input_norm, norms)
+                else:
+                    scores = np.abs(xcorr[:, :max_lag + 1]) / (input_norm * norms)[:, None]
+                    max_correlation = float(scores[:, lag].max())
+                    corr_sum = float(scores[:, lag].sum())
+                    peak = int(scores.argmax())
+                    peak_lag = peak % (max_lag + 1)
+                    peak_score = float(scores.flat[peak])
+                # 峰值足够高且连续两帧落在同一延迟附近才采用，单帧的随机峰值不会改变延迟估计；
+                # 新的延迟从下一帧开始用于评分，避免本帧又变成所有延迟中取最大值
+                if peak_score > self.echo_threshold and abs(peak_lag - self._echo_lag_candidate) <= 2:
+                    self._echo_lag = peak_lag
+                self._echo_lag_candidate = peak_lag
+        
+        # 如果有有效的相关性分数
+        if corr_count:
+            avg_correlation = corr_sum / corr_count
+            
+            # 更智能的回声检测逻辑
+            # 平方和 = 去均值平方和 + n·均值²，复用前面的结果而不再遍历一次
+            input_energy = input_ss + n * input_mean * input_mean
+            
+            # 只有在输入能量足够且相关性很高时才认为是回声
+            if (max_correlation > self.echo_threshold and 
+                avg_correlation > 0.4 and 
+                input_energy > 0.001):  # 确保有足够的信号能量
+                
+                echo_detected = True
+                
+                # 动态计算抑制因子
+                # 相关性越高，抑制越强，但保留最小比例
+                base_suppression = max_correlation * self.echo_suppression_factor
+                suppression_factor = max(self.min_suppression, 1.0 - base_suppression)
+                
+                # 频率域处理（如果启用谱减法）
+                if self.spectral_subtraction:
+                    suppression_factor = self.apply_spectral_subtraction(
+                        input_samples, ref_samples, suppression_factor)
+        
+        # 应用抑制
+        if not echo_detected:
+            return input_samples
+        
+        # 渐进式抑制，避免突然的音量变化；抑制较强（<0.5）时保留20%原始信号，保持语音自然度
+        # 两步合并为一次缩放：x*f*0.8 + x*0.2 = x*(f*0.8 + 0.2)，写入独立的输出缓冲区
+        out = self._ec_out
+        if out is None or out.shape[0] != n:
+            out = np.empty(n, dtype=np.float32)
+        if NUMBA_AVAILABLE:
+            return echo_finish(input_samples, suppression_factor, out)
+        gain = suppression_factor * 0.8 + 0.2 if suppression_factor < 0.5 else suppression_factor
+        return np.multiply(input_samples, np.float32(gain), out=out)
+
     def apply_spectral_subtraction(self, input_samples, ref_samples, base_factor):
         """谱减法增强回声消除"""
         try:
             # 简化的谱减法
             # 在频域中进行更精细的回声消除
-            input_fft = np.fft.rfft(input_samples)
-            ref_fft = np.fft.rfft(ref_samples)
-            
-            # 计算频域相关性
-            magnitude_ratio = np.abs(input_fft) / (np.abs(ref_fft) + 1e-10)
+            input_pow = self._power_spectrum(self._rfft_scratch(input_samples))
+            ref_pow = self._power_spectrum(self._rfft_scratch(ref_samples))
             
-            # 只在相似频率成分上进行抑制
-            suppression_mask = np.where(magnitude_ratio > 0.5, base_factor, 1.0)
+            # 计算频域相关性：|X|/|R| > 0.5 两边平方为 |X|² > 0.25|R|²，不需要开方也不生成比值数组
+            ref_pow *= 0.25
+            similar = np.count_nonzero(input_pow > ref_pow) / input_pow.size
             
-            return np.mean(suppression_mask)
+            # 只在相似频率成分上进行抑制：相似频点取base_factor、其余取1.0后的平均值，
+            # 直接按相似频点所占比例计算，不生成float64掩码数组
+            return similar * base_factor + (1.0 - similar)
             
         except Exception:
             return base_factor
 
-    def apply_auto_gain_control(self, audio_data):
-        """自动增益控制，保持音量稳定"""
-        if not hasattr(self, 'numpy_available'):
-            self.numpy_available = self.audio_processing_init()
+    @staticmethod
+    def _power_spectrum(spectrum):
+        """复数频谱的模平方 re² + im²，把复数看作实部虚部交替的实数数组一次求出，不做开方"""
+        pairs = spectrum.view(spectrum.real.dtype).reshape(-1, 2)
+        return np.einsum('ij,ij->i', pairs, pairs)
+
+    def _rfft_scratch(self, samples):
+        """对samples做实数FFT；帧长为chunk时先拷入可覆盖的缓冲区，scipy可原地变换并复用缓存的FFT计划"""
+        if not SCIPY_FFT_AVAILABLE:
+            return np.fft.rfft(samples)
+        buf = self._rfft_buf
+        if buf is None or buf.shape[0] != samples.shape[0]:
+            return _sp_fft.rfft(samples)
+        np.copyto(buf, samples)
+        return _sp_fft.rfft(buf, overwrite_x=True)
+
+    def apply_spectral_denoise(self, audio_data):
+        """
+        谱减法降噪：|S(k)| = max(|Y(k)| - α|N(k)|, β|Y(k)|)
         
-        if not self.numpy_available:
+        噪声幅度谱|N(k)|在静音帧（RMS低于噪声门阈值）上指数平均估计，
+        保留原始相位重建信号，比噪声门的全频带衰减更少损伤语音
+        """
+        try:
+            samples = self._to_float32(audio_data)
+            if samples.size == 0:
+                return audio_data
+            return self._to_int16_bytes(self._spectral_denoise_f32(samples))
+            
+        except Exception as e:
             return audio_data
+
+    def _spectral_denoise_f32(self, samples):
+        """谱减法降噪的浮点实现，返回新数组"""
+        n = samples.size
+        spectrum = np.fft.rfft(samples)
+        mag = np.abs(spectrum)
+        if self._noise_mag is None or self._noise_mag.shape != mag.shape:
+            self._noise_mag = np.zeros(mag.shape, dtype=np.float32)
+        
+        # 静音帧用于更新噪声估计
+        if math.sqrt(float(samples @ samples) / n) < self.noise_gate_threshold:
+            self._noise_mag *= np.float32(0.9)
+            self._noise_mag += np.float32(0.1) * mag
+            self.silence_counter += 1
+        else:
+            self.silence_counter = 0
+        
+        clean_mag = np.maximum(mag - self.spectral_alpha * self._noise_mag, self.spectral_beta * mag)
         
+        # 幅度按比例缩放，相位保持不变
+        spectrum *= clean_mag / (mag + 1e-12)
+        return np.fft.irfft(spectrum, n=n)
+
+    def apply_auto_gain_control(self, audio_data):
+        """自动增益控制，保持音量稳定"""
         try:
-            samples = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-            
-            # 计算当前RMS
-            current_rms = np.sqrt(np.mean(samples**2))
-            target_rms = 3000.0  # 目标RMS值
-            
-            if current_rms > 0:
-                # 计算增益
-                gain = min(target_rms / current_rms, 2.0)  # 限制最大增益为2倍
-                gain = max(gain, 0.5)  # 限制最小增益为0.5倍
-                
-                # 应用增益
-                samples = samples * gain
-                
-                # 硬限制，防止溢出
-                samples = np.clip(samples, -32767, 32767)
-            
-            return samples.astype(np.int16).tobytes()
+            samples = self._load_f32(self._scratch_a, audio_data, 1.0)
+            self._auto_gain_i16(samples)
+            return self._store_int16(samples)
             
         except Exception as e:
             return audio_data
 
+    def _auto_gain_i16(self, samples):
+        """对int16幅度范围的浮点样本原地做自动增益"""
+        # 计算当前RMS
+        current_rms = math.sqrt(float(samples @ samples) / samples.size)
+        target_rms = 3000.0  # 目标RMS值
+        
+        if current_rms > 0:
+            # 计算增益
+            gain = min(target_rms / current_rms, 2.0)  # 限制最大增益为2倍
+            gain = max(gain, 0.5)  # 限制最小增益为0.5倍
+            
+            # 应用增益
+            samples *= np.float32(gain)
+            
+            # 硬限制，防止溢出
+            np.clip(samples, -32767, 32767, out=samples)
+        return samples
+
     def detect_voice_activity(self, audio_data):
         """改进的语音活动检测"""
-        if not hasattr(self, 'numpy_available'):
-            self.numpy_available = self.audio_processing_init()
-        
-        if not self.numpy_available:
-            return True  # 如果无法检测，假设有语音活动
-        
         try:
-            samples = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+            raw = np.frombuffer(audio_data, dtype=np.int16)
+            n = len(raw)
+            if NUMBA_AVAILABLE:
+                energy_sum, diff_energy, zero_crossings = vad_features(raw)
+            else:
+                # 与内核一致：int16提升为int64后做整数平方和，不转浮点，结果精确
+                raw64 = raw.astype(np.int64)
+                energy_sum = int(raw64 @ raw64) * _INV_I16_SQ
             
             # 1. 能量检测
-            energy = np.sum(samples**2) / len(samples)
-            
-            # 2. 过零率检测
-            zero_crossings = np.sum(np.diff(np.sign(samples)) != 0)
-            zero_crossing_rate = zero_crossings / len(samples)
-            
-            # 3. 频谱质心（语音的频谱特征）
-            try:
-                fft = np.fft.rfft(samples)
-                magnitude = np.abs(fft)
-                freqs = np.fft.rfftfreq(len(samples), 1.0 / 16000)
-                
-                if np.sum(magnitude) > 0:
-                    spectral_centroid = np.sum(freqs * magnitude) / np.sum(magnitude)
-                else:
-                    spectral_centroid = 0
-            except:
-                spectral_centroid = 0
+            energy = float(energy_sum) / n
             
             # 4. 短时能量变化率
-            if hasattr(self, 'prev_energy'):
+            if self.prev_energy is not None:
                 energy_delta = abs(energy - self.prev_energy)
             else:
                 energy_delta = 0
@@ -975,7 +1721,7 @@ class CloudVoIPClient:
             # 自适应阈值
             if self.adaptive_threshold:
                 # 动态调整阈值
-                if hasattr(self, 'avg_noise_energy'):
+                if self.avg_noise_energy is not None:
                     self.avg_noise_energy = 0.95 * self.avg_noise_energy + 0.05 * energy
                     energy_threshold = max(self.avg_noise_energy * 3, 0.001)
                 else:
@@ -984,147 +1730,339 @@ class CloudVoIPClient:
             else:
                 energy_threshold = 0.001
             
-            # 综合判断
-            conditions = [
-                energy > energy_threshold,                    # 能量足够
-                zero_crossing_rate > 0.02,                   # 过零率适中（不是纯噪声）
-                zero_crossing_rate < 0.8,                    # 过零率不过高（不是高频噪声）
-                spectral_centroid > 100,                     # 频谱质心在语音范围
-                spectral_centroid < 4000                     # 频谱质心不过高
-            ]
-            
-            # 至少满足3个条件才认为有语音
-            voice_score = sum(conditions)
-            has_voice = voice_score >= 3
+            # 能量超过阈值时结论已经确定：能量一票，过零率的两个条件和频谱质心的两个条件
+            # 各自至少满足一个，得分必然不低于3，跳过过零率和频谱特征的计算
+            if energy > energy_threshold:
+                has_voice = True
+            else:
+                if not NUMBA_AVAILABLE:
+                    diff = np.diff(raw64)
+                    diff_energy = int(diff @ diff) * _INV_I16_SQ
+                    # 相邻样本异或为负即符号位不同，直接在int16上判断
+                    zero_crossings = np.count_nonzero((raw[1:] ^ raw[:-1]) < 0)
+                
+                # 2. 过零率检测
+                zero_crossing_rate = zero_crossings / n
+                
+                # 3. 频谱质心（语音的频谱特征）
+                # 不做FFT：由Parseval关系 sum(diff^2) = sum(|X(w)|^2 * 4sin^2(w/2))，
+                # 差分能量与能量之比给出功率加权的平均频率，单音时恰好等于其频率
+                if energy_sum > 0:
+                    ratio = min(float(diff_energy) / (4.0 * float(energy_sum)), 1.0)
+                    spectral_centroid = 16000 / math.pi * math.asin(math.sqrt(ratio))
+                else:
+                    spectral_centroid = 0
+                
+                # 综合判断：各条件转为整数直接相加计分，不构造列表
+                # （特征值可能是numpy标量，np.bool_相加是逻辑或而不是计数，必须先转int）
+                voice_score = (int(energy > energy_threshold)           # 能量足够
+                               + int(zero_crossing_rate > 0.02)         # 过零率适中（不是纯噪声）
+                               + int(zero_crossing_rate < 0.8)          # 过零率不过高（不是高频噪声）
+                               + int(spectral_centroid > 100)           # 频谱质心在语音范围
+                               + int(spectral_centroid < 4000))         # 频谱质心不过高
+                
+                # 至少满足3个条件才认为有语音
+                has_voice = voice_score >= 3
             
             # 避免频繁切换
-            if hasattr(self, 'voice_history'):
-                self.voice_history.append(has_voice)
-                if len(self.voice_history) > 5:
-                    self.voice_history.pop(0)
+            if self.voice_history:
+                self.voice_history.append(has_voice)  # deque满5帧后自动丢弃最旧的一帧
                 
                 # 使用滑动窗口平滑决策
                 recent_voice_count = sum(self.voice_history)
                 has_voice = recent_voice_count >= 3  # 5帧中至少3帧有语音
             else:
-                self.voice_history = [has_voice]
+                self.voice_history.append(has_voice)
             
             return has_voice
             
         except Exception as e:
             return True
 
-    def process_input_audio(self, audio_data):
-        """处理输入音频数据 - 改进版本"""
+    def process_input_audio(self, audio_data, denoised=None):
+        """
+        处理输入音频数据 - 改进版本
+        
+        denoised为批处理时已完成谱减法降噪的浮点样本，此时跳过逐帧降噪
+        """
+        if denoised is None:
+            return self._input_stage(audio_data)
+        return self._input_general(audio_data, denoised)
+
+    def _build_input_pipeline(self):
+        """
+        按当前处理开关选定逐帧输入处理函数
+        
+        开关只在加载配置和音频设置菜单中改变，每次改变后调用本方法，通话中每帧不再逐个判断开关
+        """
         if not self.echo_cancellation and not self.noise_suppression and not self.auto_gain_control:
             # 如果没有启用任何处理，只调整音量
-            return self.adjust_volume(audio_data, self.input_volume)
-        
-        processed_data = audio_data
+            self._input_stage = self._input_volume_only
+        elif (NUMBA_AVAILABLE and not self.debug_audio_processing and not self.echo_cancellation
+                and not (self.noise_suppression and self.spectral_subtraction)):
+            # 无回声消除和谱减法时，噪声门、自动增益和音量都只依赖整帧RMS，用融合内核一遍完成。
+            # 注意默认配置开启了回声消除（echo_cancellation=True），默认情况下走的是下面的通用流程，
+            # 只有用户在音频设置中关闭回声消除后才会用到融合内核
+            self._input_stage = self._input_fused
+        else:
+            self._input_stage = self._input_general
+
+    def _input_volume_only(self, audio_data):
+        """未启用任何处理：只调整输入音量"""
+        return self.adjust_volume(audio_data, self.input_volume, self._out_i16)
+
+    def _input_fused(self, audio_data):
+        """融合内核：噪声门、自动增益和音量调整一遍完成"""
+        try:
+            samples = np.frombuffer(audio_data, dtype=np.int16)
+            out = self._i16_buffer(self._out_i16, samples.shape[0])
+            silent = process_input_frame(samples, out, self.input_volume, self.noise_gate_threshold,
+                                         3000.0, self.noise_suppression, self.auto_gain_control)
+            if self.noise_suppression:
+                self.silence_counter = self.silence_counter + 1 if silent else 0
+            return out.tobytes()
+        except Exception:
+            return self._input_general(audio_data)
+
+    def _input_general(self, audio_data, denoised=None):
+        """通用流程：降噪、回声消除、自动增益和音量调整"""
+        # 处理日志仅在调试模式下构造，避免每帧格式化字符串
+        debug = self.debug_audio_processing
         processing_log = []
         
-        # 检测输入信号特征
-        if hasattr(self, 'numpy_available') and self.numpy_available:
-            try:
-                samples = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
-                input_energy = np.sum(samples**2) / len(samples)
-                input_rms = np.sqrt(input_energy)
-                processing_log.append(f"输入RMS: {input_rms:.4f}")
-            except:
-                input_energy = 0
-                input_rms = 0
+        # 1-4. 降噪、回声消除、自动增益和音量调整：整形转换只做一次，中间结果保持浮点
+        processed_data = self._process_capture(audio_data, processing_log if debug else None, denoised)
+        
+        # 调试信息（可选）
+        if debug:
+            print(f"[音频处理] {' -> '.join(processing_log)}")
+        
+        return processed_data
+
+    def process_input_batch(self, frames):
+        """
+        批量处理多帧输入音频
+        
+        启用谱减法降噪时，整批帧的正反FFT各做一次（scipy可用时多线程），
+        噪声估计仍按帧顺序更新；之后的回声消除、增益等逐帧进行
+        """
+        if (len(frames) < 2 or not (self.noise_suppression and self.spectral_subtraction)
+                or any(len(f) != len(frames[0]) for f in frames)):
+            return [self.process_input_audio(f) for f in frames]
+        try:
+            block = np.frombuffer(b''.join(frames), dtype=np.int16).reshape(len(frames), -1) * _INV_I16
+            denoised = self._spectral_denoise_batch(block)
+        except Exception:
+            return [self.process_input_audio(f) for f in frames]
+        return [self.process_input_audio(f, row) for f, row in zip(frames, denoised)]
+
+    def _spectral_denoise_batch(self, block):
+        """谱减法降噪的批量实现，block每行一帧，结果与逐帧调用_spectral_denoise_f32相同"""
+        n = block.shape[1]
+        if SCIPY_FFT_AVAILABLE:
+            spectra = _sp_fft.rfft(block, axis=-1, workers=-1)
+        else:
+            spectra = np.fft.rfft(block, axis=-1)
+        mags = np.abs(spectra)
+        rms = np.sqrt(np.einsum('ij,ij->i', block, block) / n)
+        if self._noise_mag is None or self._noise_mag.shape != mags.shape[1:]:
+            self._noise_mag = np.zeros(mags.shape[1:], dtype=np.float32)
+        
+        # 噪声估计依赖前面的帧，按顺序逐帧更新
+        for spectrum, mag, frame_rms in zip(spectra, mags, rms):
+            if frame_rms < self.noise_gate_threshold:
+                self._noise_mag *= np.float32(0.9)
+                self._noise_mag += np.float32(0.1) * mag
+                self.silence_counter += 1
+            else:
+                self.silence_counter = 0
+            clean_mag = np.maximum(mag - self.spectral_alpha * self._noise_mag, self.spectral_beta * mag)
+            spectrum *= clean_mag / (mag + 1e-12)
+        
+        if SCIPY_FFT_AVAILABLE:
+            return _sp_fft.irfft(spectra, n=n, axis=-1, workers=-1)
+        return np.fft.irfft(spectra, n=n, axis=-1)
+
+    def _process_capture(self, audio_data, processing_log=None, denoised=None):
+        """
+        采集音频的降噪、回声消除、自动增益和音量调整（融合实现）
+        
+        一次转换为浮点，依次做噪声门/谱减法降噪、回声消除和过度抑制恢复、自动增益、音量调整，
+        各步骤在同一个数组上原地进行，最后一次写回int16；processing_log不为None时追加调试日志
+        """
+        try:
+            samples = self._to_float32(audio_data)
+            if samples.size == 0:
+                return audio_data
+        except Exception:
+            return audio_data
+        
+        # 检测输入信号特征（仅用于调试输出）
+        if processing_log is not None:
+            input_rms = math.sqrt(float(samples @ samples) / samples.size)
+            processing_log.append(f"输入RMS: {input_rms:.4f}")
         
         # 1. 噪声门 - 但要更宽松
-        if self.noise_suppression:
-            processed_data = self.apply_noise_gate(processed_data)
-            processing_log.append("应用噪声门")
+        if denoised is not None:
+            samples = denoised
+            if processing_log is not None:
+                processing_log.append("谱减法降噪（批处理）")
+        elif self.noise_suppression:
+            try:
+                if self.spectral_subtraction:
+                    samples = self._spectral_denoise_f32(samples)
+                    if processing_log is not None:
+                        processing_log.append("谱减法降噪")
+                else:
+                    self._noise_gate_f32(samples)
+                    if processing_log is not None:
+                        processing_log.append("应用噪声门")
+            except Exception:
+                pass
         
         # 2. 回声消除 - 仅在有足够历史数据时应用
         if self.echo_cancellation and len(self.audio_history) >= 2:
-            # 使用最近的输出音频作为参考，但要检查能量
-            reference = self.audio_history[-1] if self.audio_history else None
-            if reference:
-                # 检查参考信号强度，避免在无输出时进行回声消除
-                try:
-                    ref_samples = np.frombuffer(reference, dtype=np.int16).astype(np.float32) / 32768.0
-                    ref_energy = np.sum(ref_samples**2) / len(ref_samples)
+            try:
+                # 检查最近输出音频（参考信号）的强度，避免在无输出时进行回声消除；
+                # 能量在写入参考缓冲区时已经算好
+                if self._ref_energy > 0.0001:
+                    old_samples = samples
+                    samples = self._echo_suppress_f32(old_samples)
                     
-                    # 只有在参考信号有足够能量时才进行回声消除
-                    if ref_energy > 0.0001:
-                        old_data = processed_data
-                        processed_data = self.apply_echo_cancellation(processed_data, reference)
+                    # 检查是否过度抑制（未检测到回声时返回的就是原数组）
+                    if samples is not old_samples:
+                        old_rms = math.sqrt(float(old_samples @ old_samples) / old_samples.size)
+                        new_rms = math.sqrt(float(samples @ samples) / samples.size)
                         
-                        # 检查是否过度抑制
-                        if hasattr(self, 'numpy_available') and self.numpy_available:
-                            try:
-                                old_samples = np.frombuffer(old_data, dtype=np.int16).astype(np.float32) / 32768.0
-                                new_samples = np.frombuffer(processed_data, dtype=np.int16).astype(np.float32) / 32768.0
-                                
-                                old_rms = np.sqrt(np.sum(old_samples**2) / len(old_samples))
-                                new_rms = np.sqrt(np.sum(new_samples**2) / len(new_samples))
-                                
-                                # 如果抑制过度（超过90%），恢复部分原始信号
-                                if old_rms > 0 and (new_rms / old_rms) < 0.1:
-                                    recovery_factor = 0.3
-                                    recovered_samples = new_samples * (1 - recovery_factor) + old_samples * recovery_factor
-                                    processed_data = (np.clip(recovered_samples * 32767, -32767, 32767)).astype(np.int16).tobytes()
-                                    processing_log.append(f"回声消除+恢复 (因子: {recovery_factor})")
-                                else:
-                                    processing_log.append(f"回声消除 (抑制率: {1-(new_rms/old_rms if old_rms > 0 else 0):.2f})")
-                            except:
-                                processing_log.append("回声消除")
-                    else:
-                        processing_log.append("跳过回声消除 (参考信号弱)")
-                except:
-                    pass
-        elif self.echo_cancellation:
+                        # 如果抑制过度（超过90%），恢复部分原始信号
+                        if old_rms > 0 and (new_rms / old_rms) < 0.1:
+                            recovery_factor = 0.3
+                            samples = samples * (1 - recovery_factor) + old_samples * recovery_factor
+                            if processing_log is not None:
+                                processing_log.append(f"回声消除+恢复 (因子: {recovery_factor})")
+                        elif processing_log is not None:
+                            processing_log.append(f"回声消除 (抑制率: {1-(new_rms/old_rms if old_rms > 0 else 0):.2f})")
+                    elif processing_log is not None:
+                        processing_log.append("回声消除 (抑制率: 0.00)")
+                elif processing_log is not None:
+                    processing_log.append("跳过回声消除 (参考信号弱)")
+            except Exception:
+                pass
+        elif self.echo_cancellation and processing_log is not None:
             processing_log.append("等待回声消除历史数据")
         
+        # 限幅到int16范围（原地）
+        np.multiply(samples, _I16_MAX, out=samples)
+        np.clip(samples, -_I16_MAX, _I16_MAX, out=samples)
+        
         # 3. 自动增益控制 - 最后应用
         if self.auto_gain_control:
-            processed_data = self.apply_auto_gain_control(processed_data)
-            processing_log.append("自动增益控制")
+            try:
+                self._auto_gain_i16(samples)
+                if processing_log is not None:
+                    processing_log.append("自动增益控制")
+            except Exception:
+                pass
         
         # 4. 音量调整
-        processed_data = self.adjust_volume(processed_data, self.input_volume)
-        processing_log.append(f"音量调整 ({self.input_volume})")
-        
-        # 调试信息（可选）
-        if hasattr(self, 'debug_audio_processing') and self.debug_audio_processing:
-            if processing_log:
-                print(f"[音频处理] {' -> '.join(processing_log)}")
-        
-        return processed_data
+        volume = self.input_volume
+        if volume != 1.0:
+            samples *= np.float32(volume)
+            if volume > 1.0:
+                np.clip(samples, -32767, 32767, out=samples)
+        if processing_log is not None:
+            processing_log.append(f"音量调整 ({volume})")
+        
+        # 转换回字节数据
+        return self._store_int16(samples)
 
     def process_output_audio(self, audio_data):
         """处理输出音频数据"""
         # 调整输出音量
-        processed_data = self.adjust_volume(audio_data, self.output_volume)
+        if self.output_volume == 1.0:
+            processed_data = audio_data
+        else:
+            processed_data = self.adjust_volume(audio_data, self.output_volume, self._rx_i16)
         
         # 保存到历史记录用于回声消除
         if self.echo_cancellation:
-            self.audio_history.append(processed_data)
-            if len(self.audio_history) > self.history_size:
-                self.audio_history.pop(0)
+            self.add_echo_reference(processed_data)
         
         return processed_data
 
-    def adjust_volume(self, audio_data, volume):
-        """调整音频音量"""
-        if volume == 1.0:
-            return audio_data
+    def add_echo_reference(self, audio_data):
+        """记录一帧扬声器输出作为回声参考（超过history_size时自动丢弃最旧的帧）"""
+        self.audio_history.append(audio_data)
+        self._push_echo_reference(audio_data)
+
+    def clear_echo_history(self):
+        """清空回声参考历史"""
+        self.audio_history = collections.deque(maxlen=self.history_size)
+        self._reset_echo_history()
+
+    def _reset_echo_history(self):
+        """
+        按当前帧长和历史帧数重建回声参考的浮点环形缓冲区
         
-        if not hasattr(self, 'numpy_available'):
-            self.numpy_available = self.audio_processing_init()
+        每帧写入两次（i 和 i+size），最近任意W帧总是一段连续的行，
+        回声检测可以直接对这段切片做批量运算，不需要拷贝
+        """
+        size = max(1, self.history_size)
+        self._hist_f = np.zeros((2 * size, self.chunk), dtype=np.float32)  # 归一化后的参考帧
+        self._hist_norm = np.zeros(2 * size, dtype=np.float64)            # 每帧去均值后的范数
+        self._hist_F = np.zeros((2 * size, self.chunk + 1), dtype=np.complex64)  # 去均值后补零到2倍长度的频谱
+        self._hist_pos = 0
+        self._ref_energy = 0.0  # 最近一帧参考信号的平均能量
+        self._echo_lag = 0             # 跟踪到的回声延迟（采样数），回声检测只在此延迟处评分
+        self._echo_lag_candidate = -1  # 上一帧互相关峰值所在的延迟
+
+    def _push_echo_reference(self, audio_data):
+        """把一帧输出音频转换为浮点后写入回声参考缓冲区，只在写入时转换一次"""
+        size = len(self._hist_norm) // 2
+        i = self._hist_pos
+        samples = np.frombuffer(audio_data, dtype=np.int16)
+        if len(samples) == self.chunk:
+            row = self._hist_f[i]
+            row[:] = samples
+            row *= _INV_I16
+            self._ref_energy = float(row @ row) / len(row)
+            centered = row - row.mean()
+            norm = math.sqrt(float(centered @ centered))
+            self._hist_f[i + size] = row
+            # 频谱只在写入时计算一次，之后每帧回声检测直接复用
+            self._hist_F[i] = self._hist_F[i + size] = np.fft.rfft(centered, n=2 * self.chunk)
+        else:
+            # 帧长不一致的帧不参与相关性计算
+            norm = 0.0
+            ref = self._load_f32(None, samples)
+            self._ref_energy = float(ref @ ref) / len(ref) if len(ref) else 0.0
+        self._hist_norm[i] = self._hist_norm[i + size] = norm
+        self._hist_pos = (i + 1) % size
+
+    def adjust_volume(self, audio_data, volume, out=None):
+        """
+        调整音频音量
         
-        if not self.numpy_available:
+        out为调用线程自己的int16缓冲区，足够容纳本帧时结果写入其中，避免每帧分配
+        """
+        if volume == 1.0:
             return audio_data
         
         try:
-            samples = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-            samples = samples * volume
-            samples = np.clip(samples, -32767, 32767)
-            return samples.astype(np.int16).tobytes()
+            # Q15定点：音量乘以32768取整后做整数乘法和带舍入的右移，不经过浮点转换
+            q15 = int(volume * 32768 + 0.5)
+            raw = np.frombuffer(audio_data, dtype=np.int16)
+            out = self._i16_buffer(out, raw.shape[0])
+            if NUMBA_AVAILABLE:
+                return volume_q15(raw, q15, out).tobytes()
+            samples = raw.astype(np.int32)
+            samples *= q15
+            samples += 16384
+            samples >>= 15
+            # 结果限制在±32767（与其他处理步骤一致）
+            np.clip(samples, -32767, 32767, out=samples)
+            np.copyto(out, samples, casting='unsafe')
+            return out.tobytes()
         except Exception as e:
             return audio_data
 
@@ -1135,113 +2073,216 @@ class CloudVoIPClient:
         
         while self.current_call and self.audio_input:
             try:
-                # 读取音频数据
-                data = self.audio_input.read(self.chunk, exception_on_overflow=False)
-                frames_processed += 1
+                # 取出麦克风回调投递的音频帧，队列为空时等待唤醒
+                try:
+                    data = self._audio_tx_q.popleft()
+                except IndexError:
+                    # 暂无新帧时先发出未凑满一批的包，避免音频滞留（网络线程启用时由其负责）
+                    if self._audio_net is None and self._audio_batch is not None and self._audio_batch.count:
+                        try:
+                            self._audio_batch.flush()
+                        except OSError as send_e:
+                            print(f"音频发送失败: {send_e}")
+                    # 先清除事件再复查队列，避免丢失回调的唤醒信号
+                    self._audio_tx_event.clear()
+                    if not self._audio_tx_q:
+                        self._audio_tx_event.wait(timeout=0.5)
+                    continue
+                # 批处理模式下一并取出已积压的帧（不额外等待，不增加延迟）
+                frames = [data]
+                if self.batch_mode:
+                    while len(frames) < self.batch_size:
+                        try:
+                            frames.append(self._audio_tx_q.popleft())
+                        except IndexError:
+                            break
                 
-                # 语音活动检测
-                has_voice = True
-                if self.voice_activity_detection:
-                    has_voice = self.detect_voice_activity(data)
+                voiced = []
+                for data in frames:
+                    frames_processed += 1
                     
-                    if not has_voice:
-                        consecutive_silence += 1
-                        # 允许短暂的静音期，避免切断正常语音间隙
-                        if consecutive_silence < 3:  # 允许3帧的静音
-                            has_voice = True
-                    else:
-                        consecutive_silence = 0
-                
-                # 如果检测到语音活动或关闭了VAD，进行处理
-                if has_voice or not self.voice_activity_detection:
-                    # 音频处理
-                    processed_data = self.process_input_audio(data)
+                    # 语音活动检测
+                    has_voice = True
+                    if self.voice_activity_detection:
+                        has_voice = self.detect_voice_activity(data)
+                        
+                        if not has_voice:
+                            consecutive_silence += 1
+                            # 允许短暂的静音期，避免切断正常语音间隙
+                            if consecutive_silence < 3:  # 允许3帧的静音
+                                has_voice = True
+                        else:
+                            consecutive_silence = 0
+                    
+                    # 如果检测到语音活动或关闭了VAD，进行处理
+                    if has_voice or not self.voice_activity_detection:
+                        voiced.append(data)
+                    # 静音帧直接跳过发送
+                    
+                    # 定期状态报告
+                    if self.debug_audio_processing and frames_processed % 1000 == 0:
+                        print(f"[音频状态] 已处理 {frames_processed} 帧，连续静音 {consecutive_silence} 帧")
                     
+                # 音频处理
+                if len(voiced) > 1:
+                    processed_frames = self.process_input_batch(voiced)
+                else:
+                    processed_frames = [self.process_input_audio(data) for data in voiced]
+                
+                for data, processed_data in zip(voiced, processed_frames):
                     # 检查处理后是否还有信号
-                    if hasattr(self, 'numpy_available') and self.numpy_available:
-                        try:
-                            processed_samples = np.frombuffer(processed_data, dtype=np.int16).astype(np.float32)
-                            processed_energy = np.sum(processed_samples**2) / len(processed_samples)
+                    try:
+                        processed_samples = None
+                        if NUMBA_AVAILABLE:
+                            # 直接在int16上求平方和，不做浮点转换
+                            raw = np.frombuffer(processed_data, dtype=np.int16)
+                            processed_energy = sum_squares_i16(raw) / len(raw)
+                        else:
+                            processed_samples = self._load_f32(self._scratch_a, processed_data, 1.0)
+                            processed_energy = float(processed_samples @ processed_samples) / len(processed_samples)
+                        
+                        # 如果处理后能量过低，使用原始数据的一定比例
+                        if processed_energy < 10:  # 很低的阈值
+                            if NUMBA_AVAILABLE:
+                                raw = np.frombuffer(data, dtype=np.int16)
+                                original_energy = sum_squares_i16(raw) / len(raw)
+                            else:
+                                original_samples = self._load_f32(self._scratch_b, data, 1.0)
+                                original_energy = float(original_samples @ original_samples) / len(original_samples)
                             
-                            # 如果处理后能量过低，使用原始数据的一定比例
-                            if processed_energy < 10:  # 很低的阈值
-                                original_samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
-                                original_energy = np.sum(original_samples**2) / len(original_samples)
+                            if original_energy > 1000:  # 原始信号有足够能量
+                                # 混合原始信号和处理后信号（只在这种少见情况下才转换为浮点）
+                                if processed_samples is None:
+                                    processed_samples = self._load_f32(self._scratch_a, processed_data, 1.0)
+                                    original_samples = self._load_f32(self._scratch_b, data, 1.0)
+                                processed_samples *= np.float32(0.7)
+                                original_samples *= np.float32(0.3)
+                                processed_samples += original_samples
+                                processed_data = self._store_int16(processed_samples)
                                 
-                                if original_energy > 1000:  # 原始信号有足够能量
-                                    # 混合原始信号和处理后信号
-                                    mixed_samples = processed_samples * 0.7 + original_samples * 0.3
-                                    processed_data = mixed_samples.astype(np.int16).tobytes()
-                                    
-                                    if frames_processed % 100 == 0:  # 每100帧打印一次
-                                        print(f"[音频恢复] 混合原始信号以保持音质")
-                        except:
-                            pass
+                                if frames_processed % 100 == 0:  # 每100帧打印一次
+                                    print(f"[音频恢复] 混合原始信号以保持音质")
+                    except:
+                        pass
                     
-                    # 构造音频包并发送
-                    if self.audio_socket and self.current_call:
-                        target_id = self.current_call.get('peer', '')
-                        if target_id:
-                            # 构造包头：源客户端ID + 目标客户端ID
-                            header = self.client_id.encode('utf-8').ljust(16, b'\x00')
-                            header += target_id.encode('utf-8').ljust(16, b'\x00')
-                            packet = header + processed_data
-                            
-                            try:
-                                self.audio_socket.sendto(packet, (self.server_ip, self.audio_port))
-                            except Exception as send_e:
-                                print(f"音频发送失败: {send_e}")
+                    # 多帧合并：攒够本次通话协商的帧数后作为一个包发送
+                    if self._frames_per_packet > 1:
+                        self._tx_frames.append(processed_data)
+                        if len(self._tx_frames) >= self._frames_per_packet:
+                            self._send_audio_payload(self._pack_frames())
                     else:
-                        time.sleep(0.01)
-                else:
-                    # 发送静音或跳过发送
-                    time.sleep(0.01)
-                    
-                # 定期状态报告
-                if frames_processed % 1000 == 0 and hasattr(self, 'debug_audio_processing') and self.debug_audio_processing:
-                    print(f"[音频状态] 已处理 {frames_processed} 帧，连续静音 {consecutive_silence} 帧")
+                        self._send_audio_payload(processed_data)
+                
+                # 语音段结束（本批没有要发送的帧）时立即发出未凑满的合并帧，尾音不滞留到下一段语音
+                if not voiced and self._tx_frames:
+                    self._send_audio_payload(self._pack_frames())
                     
             except Exception as e:
                 if self.current_call:
                     print(f"音频发送错误: {e}")
                 break
 
+    def _send_audio_payload(self, processed_data):
+        """构造音频包并发送（负载为一帧音频，或多帧合并包）"""
+        if self.audio_socket and self.current_call:
+            call_hdr = self._call_hdr
+            if call_hdr and self._audio_net is None and self._audio_batch is None \
+                    and hasattr(self.audio_socket, 'sendmsg'):
+                # 逐包发送时用分散写直接发出包头和音频数据，不拷贝到发送缓冲区
+                try:
+                    self.audio_socket.sendmsg((call_hdr, processed_data), (), 0, self._audio_addr)
+                except Exception as send_e:
+                    print(f"音频发送失败: {send_e}")
+            elif call_hdr:
+                # 包头已在通话建立时写入发送缓冲区，只需拷贝音频数据（切片赋值即一次memcpy）
+                packet_size = 32 + len(processed_data)
+                if packet_size <= len(self._send_buf):
+                    self._send_mv[32:packet_size] = processed_data
+                    packet = self._send_mv[:packet_size]
+                else:
+                    packet = call_hdr + processed_data
+                
+                try:
+                    if self._audio_net is not None:
+                        self._audio_net.put(packet)
+                    elif self._audio_batch is not None:
+                        self._audio_batch.add(packet)
+                    else:
+                        self.audio_socket.sendto(packet, self._audio_addr)
+                except Exception as send_e:
+                    print(f"音频发送失败: {send_e}")
+
+    def _pack_frames(self):
+        """取出待合并的帧组成一个负载：单帧原样发送，多帧为1字节帧数 + 各帧数据（总长为奇数，接收端据此区分）"""
+        frames, self._tx_frames = self._tx_frames, []
+        if len(frames) == 1:
+            return frames[0]
+        return bytes((len(frames),)) + b''.join(frames)
+
     def audio_receive_loop(self):
         """音频接收循环"""
-        # 设置更长的超时，避免过度阻塞
-        if self.audio_socket:
-            self.audio_socket.settimeout(1.0)  # 增加到1秒
-            
-        while self.current_call and self.audio_output:
-            try:
-                # 从服务器接收音频数据
-                if self.audio_socket:
-                    try:
-                        data, addr = self.audio_socket.recvfrom(4096)
+        if not self.audio_socket or not self._shutdown_r:
+            return
+        
+        # 同时等待音频数据和停止信号，无数据时线程一直休眠，不再定时轮询
+        sel = selectors.DefaultSelector()
+        sel.register(self.audio_socket, selectors.EVENT_READ)
+        sel.register(self._shutdown_r, selectors.EVENT_READ)
+        
+        try:
+            while self.current_call and self.audio_output:
+                try:
+                    for key, _ in sel.select():
+                        if key.fileobj is self._shutdown_r:
+                            return
                         
-                        # 解析包头，提取音频数据
-                        if len(data) > 32:  # 32字节包头（16字节源ID + 16字节目标ID）
-                            audio_data = data[32:]
-                            
-                            # 处理接收到的音频数据
-                            if len(audio_data) > 0:
-                                processed_audio = self.process_output_audio(audio_data)
-                                
-                                # 播放音频数据
-                                self.audio_output.write(processed_audio)
-                    except socket.timeout:
-                        # 正常超时，继续循环
-                        continue
-                    except Exception as recv_e:
-                        print(f"音频接收异常: {recv_e}")
-                        time.sleep(0.01)
-                else:
-                    time.sleep(0.01)
-                    
-            except Exception as e:
-                if self.current_call:
-                    print(f"音频接收错误: {e}")
-                break
+                        # 从服务器接收音频数据
+                        try:
+                            rx_batch = self._audio_rx_batch
+                            if rx_batch is not None:
+                                # 一次系统调用取出所有已到达的包
+                                for i in range(rx_batch.recv()):
+                                    self._handle_audio_packet(rx_batch.views[i], rx_batch.length(i))
+                            else:
+                                nbytes, addr = self.audio_socket.recvfrom_into(self._recv_buf, AUDIO_MAX_PACKET)
+                                self._handle_audio_packet(self._recv_mv, nbytes)
+                        except Exception as recv_e:
+                            print(f"音频接收异常: {recv_e}")
+                            time.sleep(0.01)
+                        
+                except Exception as e:
+                    if self.current_call:
+                        print(f"音频接收错误: {e}")
+                    break
+        finally:
+            sel.close()
+
+    def _handle_audio_packet(self, packet, nbytes):
+        """解析一个收到的音频包（packet为缓冲区视图，前nbytes字节有效），处理后放入播放队列"""
+        # 解析包头，提取音频数据
+        if nbytes <= 32:  # 32字节包头（16字节源ID + 16字节目标ID）
+            return
+        if (nbytes - 32) & 1:
+            # 多帧合并包（负载长度为奇数）：1字节帧数 + 等长的各帧
+            count = packet[32]
+            size = (nbytes - 33) // count if count else 0
+            starts = range(33, 33 + count * size, size) if size else ()
+        else:
+            size = nbytes - 32
+            starts = (32,)
+        
+        for start in starts:
+            # PyAudio需要bytes，这里只做一次拷贝
+            audio_data = bytes(packet[start:start + size])
+            
+            # 处理接收到的音频数据（音量为1且未启用回声消除时无需处理）
+            if self.output_volume != 1.0 or self.echo_cancellation:
+                processed_audio = self.process_output_audio(audio_data)
+            else:
+                processed_audio = audio_data
+            
+            # 放入播放队列，由扬声器回调取出播放
+            self._audio_rx_q.append(processed_audio)
 
     def show_clients(self):
         """显示在线客户端"""
@@ -1283,9 +2324,44 @@ class CloudVoIPClient:
         print("🤖 提示: 已开启自动接听模式，来电将自动接受")
         print("=" * 60)
         
+        if PROMPT_TOOLKIT_AVAILABLE and sys.stdin.isatty() and sys.stdout.isatty():
+            # 整个控制台（含各子菜单）复用同一个会话；连接断开时由接收线程中断提示
+            self._prompt_session = PromptSession()
+            try:
+                with patch_stdout():
+                    self._command_loop(None)
+            finally:
+                self._prompt_session = None
+            return
+        
+        # POSIX下用选择器等待终端输入，连接断开时能及时退出控制台而不是卡在input()上
+        stdin_sel = None
+        if os.name != 'nt':
+            try:
+                stdin_sel = selectors.DefaultSelector()
+                stdin_sel.register(sys.stdin, selectors.EVENT_READ)
+            except (ValueError, OSError):
+                stdin_sel = None
+        
+        self._stdin_sel = stdin_sel
+        try:
+            self._command_loop(stdin_sel)
+        finally:
+            self._stdin_sel = None
+            if stdin_sel:
+                stdin_sel.close()
+
+    def _command_loop(self, stdin_sel):
+        """控制台命令循环，直到用户退出或连接断开"""
         while self.running and self.connected:
             try:
-                cmd_line = input(f"{self.client_name}> ").strip()
+                cmd_line = self._read_command(f"{self.client_name}> ", stdin_sel)
+                if cmd_line is None:
+                    if self.connected:
+                        continue
+                    print("\n与服务器的连接已断开")
+                    break
+                cmd_line = cmd_line.strip()
                 if not cmd_line:
                     continue
                 
@@ -1369,6 +2445,64 @@ class CloudVoIPClient:
             except EOFError:
                 break
 
+    def _read_command(self, prompt: str, stdin_sel=None) -> Optional[str]:
+        """
+        读取一行命令
+        
+        有选择器时每0.5秒检查一次连接状态，连接断开或客户端停止时返回None；
+        使用prompt_toolkit时提示被接收线程中断同样返回None
+        """
+        if self._prompt_session is not None:
+            return self._prompt_session.prompt(prompt)
+        if stdin_sel is None:
+            return input(prompt)
+        
+        # 直接读文件描述符并自行分行：带缓冲的readline会把一次粘贴的多行全部读进缓冲区，
+        # 之后描述符不再可读，剩下的命令要等到下一次输入才会被处理
+        print(prompt, end='', flush=True)
+        pending = self._stdin_pending
+        while True:
+            newline = pending.find(b'\n')
+            if newline >= 0:
+                line = bytes(pending[:newline])
+                del pending[:newline + 1]
+                return line.decode(sys.stdin.encoding or 'utf-8', errors='replace').rstrip('\r')
+            if not (self.running and self.connected):
+                return None
+            if stdin_sel.select(timeout=0.5):
+                data = os.read(sys.stdin.fileno(), 4096)
+                if not data:
+                    if not pending:
+                        raise EOFError
+                    # 最后一行没有换行符
+                    pending += b'\n'
+                pending += data
+
+    def _input(self, prompt: str = '') -> str:
+        """子菜单读取一行输入，与控制台命令使用同一个输入来源（prompt_toolkit会话或终端选择器）"""
+        if self._prompt_session is not None:
+            line = self._prompt_session.prompt(prompt)
+        elif self._stdin_sel is not None:
+            # 与命令行共用同一个输入缓冲，粘贴的多行输入按顺序交给各级菜单
+            line = self._read_command(prompt, self._stdin_sel)
+        else:
+            return input(prompt)
+        if line is None:
+            # 连接断开，输入被中断
+            raise EOFError
+        return line
+
+    def _reprint_prompt(self):
+        """后台线程打印通知后重新显示命令提示符（prompt_toolkit会自行重绘，无需处理）"""
+        if self._prompt_session is None:
+            print(f"{self.client_name}> ", end="", flush=True)
+
+    def _interrupt_prompt(self):
+        """连接断开时中断正在等待输入的prompt_toolkit提示，让控制台退出"""
+        session = self._prompt_session
+        if session is not None and session.app.is_running:
+            session.app.loop.call_soon_threadsafe(session.app.exit)
+
     def interactive_call(self):
         """交互式发起通话"""
         print("\n📞 发起通话")
@@ -1393,7 +2527,7 @@ class CloudVoIPClient:
             print(f"  0. 取消")
             
             try:
-                choice = input("\n请选择 (0-{}): ".format(len(clients_list))).strip()
+                choice = self._input("\n请选择 (0-{}): ".format(len(clients_list))).strip()
                 if not choice or choice == '0':
                     print("已取消通话")
                     return
@@ -1431,7 +2565,7 @@ class CloudVoIPClient:
         
         while True:
             try:
-                choice = input("请输入选项 (1/2): ").strip()
+                choice = self._input("请输入选项 (1/2): ").strip()
                 
                 if choice == '1':
                     self.hangup_call()
@@ -1470,7 +2604,7 @@ class CloudVoIPClient:
             print(f"  0. 取消")
             
             try:
-                choice = input("\n请选择 (0-{}): ".format(len(clients_list))).strip()
+                choice = self._input("\n请选择 (0-{}): ".format(len(clients_list))).strip()
                 if not choice or choice == '0':
                     print("已取消发送")
                     return
@@ -1481,7 +2615,7 @@ class CloudVoIPClient:
                     target_name = clients_list[choice_num - 1][1].get('name', target_id)
                     
                     # 输入消息内容
-                    message = input(f"\n请输入要发送给 {target_name} 的消息: ").strip()
+                    message = self._input(f"\n请输入要发送给 {target_name} 的消息: ").strip()
                     if message:
                         if self.send_private_message(target_id, message):
                             print(f"✅ 消息已发送给 {target_name}")
@@ -1513,14 +2647,14 @@ class CloudVoIPClient:
             print(f"  5. 输入音量:     {self.input_volume:.1f}")
             print(f"  6. 输出音量:     {self.output_volume:.1f}")
             print(f"  7. 噪声门阈值:   {self.noise_gate_threshold:.3f}")
-            print(f"  8. 调试模式:     {'✅ 启用' if getattr(self, 'debug_audio_processing', False) else '❌ 禁用'}")
+            print(f"  8. 调试模式:     {'✅ 启用' if self.debug_audio_processing else '❌ 禁用'}")
             print("  9. 重置为默认设置")
             print("  s. 保存当前设置")
             print("  0. 返回主菜单")
             print(f"{'='*60}")
             
             try:
-                choice = input("请选择 (0-9/s): ").strip().lower()
+                choice = self._input("请选择 (0-9/s): ").strip().lower()
                 
                 if choice == '0':
                     break
@@ -1538,7 +2672,7 @@ class CloudVoIPClient:
                     print(f"语音活动检测已{'启用' if self.voice_activity_detection else '禁用'}")
                 elif choice == '5':
                     try:
-                        new_volume = float(input(f"输入新的输入音量 (0.0-1.0, 当前: {self.input_volume}): "))
+                        new_volume = float(self._input(f"输入新的输入音量 (0.0-1.0, 当前: {self.input_volume}): "))
                         if 0.0 <= new_volume <= 1.0:
                             self.input_volume = new_volume
                             print(f"输入音量设置为: {new_volume}")
@@ -1548,7 +2682,7 @@ class CloudVoIPClient:
                         print("❌ 请输入有效数字")
                 elif choice == '6':
                     try:
-                        new_volume = float(input(f"输入新的输出音量 (0.0-1.0, 当前: {self.output_volume}): "))
+                        new_volume = float(self._input(f"输入新的输出音量 (0.0-1.0, 当前: {self.output_volume}): "))
                         if 0.0 <= new_volume <= 1.0:
                             self.output_volume = new_volume
                             print(f"输出音量设置为: {new_volume}")
@@ -1558,7 +2692,7 @@ class CloudVoIPClient:
                         print("❌ 请输入有效数字")
                 elif choice == '7':
                     try:
-                        new_threshold = float(input(f"输入新的噪声门阈值 (0.0-1.0, 当前: {self.noise_gate_threshold}): "))
+                        new_threshold = float(self._input(f"输入新的噪声门阈值 (0.0-1.0, 当前: {self.noise_gate_threshold}): "))
                         if 0.0 <= new_threshold <= 1.0:
                             self.noise_gate_threshold = new_threshold
                             print(f"噪声门阈值设置为: {new_threshold}")
@@ -1567,7 +2701,7 @@ class CloudVoIPClient:
                     except ValueError:
                         print("❌ 请输入有效数字")
                 elif choice == '8':
-                    self.debug_audio_processing = not getattr(self, 'debug_audio_processing', False)
+                    self.debug_audio_processing = not self.debug_audio_processing
                     print(f"音频调试模式已{'启用' if self.debug_audio_processing else '禁用'}")
                     if self.debug_audio_processing:
                         print("💡 提示: 调试模式会显示音频处理详细信息")
@@ -1578,6 +2712,9 @@ class CloudVoIPClient:
                     self.save_audio_config()
                 else:
                     print("❌ 无效选择")
+                
+                # 处理开关可能已改变，重新选定输入处理流程
+                self._build_input_pipeline()
                     
             except KeyboardInterrupt:
                 print("\n返回主菜单")
@@ -1596,30 +2733,37 @@ class CloudVoIPClient:
     def save_audio_config(self, config_file='audio_config.json'):
         """保存当前音频配置"""
         try:
-            config = {
-                "audio_settings": {
-                    "echo_cancellation": self.echo_cancellation,
-                    "noise_suppression": self.noise_suppression,
-                    "auto_gain_control": self.auto_gain_control,
-                    "voice_activity_detection": self.voice_activity_detection,
-                    "input_volume": self.input_volume,
-                    "output_volume": self.output_volume,
-                    "noise_gate_threshold": self.noise_gate_threshold,
-                    "echo_delay_samples": self.echo_delay_samples,
-                    "history_size": self.history_size,
-                    "silence_threshold": self.silence_threshold
-                },
-                "advanced_settings": {
-                    "chunk_size": self.chunk,
-                    "sample_rate": self.rate,
-                    "channels": self.channels,
-                    "format": "paInt16"
+            # 设置未变化时直接复用上次序列化的结果
+            key = (self.echo_cancellation, self.noise_suppression, self.auto_gain_control,
+                   self.voice_activity_detection, self.input_volume, self.output_volume,
+                   self.noise_gate_threshold, self.echo_delay_samples, self.history_size,
+                   self.silence_threshold, self.chunk, self.rate, self.channels)
+            cached_key, blob = self._audio_config_cache
+            if key != cached_key:
+                config = {
+                    "audio_settings": {
+                        "echo_cancellation": self.echo_cancellation,
+                        "noise_suppression": self.noise_suppression,
+                        "auto_gain_control": self.auto_gain_control,
+                        "voice_activity_detection": self.voice_activity_detection,
+                        "input_volume": self.input_volume,
+                        "output_volume": self.output_volume,
+                        "noise_gate_threshold": self.noise_gate_threshold,
+                        "echo_delay_samples": self.echo_delay_samples,
+                        "history_size": self.history_size,
+                        "silence_threshold": self.silence_threshold
+                    },
+                    "advanced_settings": {
+                        "chunk_size": self.chunk,
+                        "sample_rate": self.rate,
+                        "channels": self.channels,
+                        "format": "paInt16"
+                    }
                 }
-            }
+                blob = _dumps(config) if CONFIG_COMPACT else _dumps_pretty(config)
+                self._audio_config_cache = (key, blob)
             
-            config_path = get_config_path(config_file)
-            with open(config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
+            _write_atomic(get_config_path(config_file), blob)
             
             print(f"✅ 音频配置已保存到: {config_file}")
             
@@ -1632,7 +2776,7 @@ class CloudVoIPClient:
         print("-" * 40)
         
         try:
-            message = input("请输入广播消息内容: ").strip()
+            message = self._input("请输入广播消息内容: ").strip()
             if message:
                 if self.send_broadcast(message):
                     print("✅ 广播消息已发送")
@@ -1652,65 +2796,131 @@ class CloudVoIPClient:
             self.running = False
         self.connected = False
         
-        # 挂断当前通话
+        # 挂断当前通话（只发送挂断通知，音频流在下面交给后台线程停止）
         if self.current_call:
-            self.hangup_call()
+            self.hangup_call(stop_streams=False)
         
-        # 停止音频流
-        self.stop_audio_streams()
-        
-        # 关闭套接字
+        # 停止音频流：先让音频线程退出，流的停止、关闭和PortAudio的释放交给后台线程，
+        # 不阻塞断开流程；进程退出前等待其完成
+        streams = (self.audio_input, self.audio_output)
+        self.audio_input = None
+        self.audio_output = None
+        self._wake_audio_threads()
+        audio_instance, self.audio_instance = self.audio_instance, None
+        if audio_instance is self._shared_audio:
+            audio_instance = None  # 共享实例由调用方释放
+        if audio_instance is not None or any(streams):
+            self._audio_finalizer = _start_audio_finalizer(audio_instance, streams)
+        
+        # 等待发送线程发完队列中的消息（如挂断通知）
+        if self._tx_thread:
+            self._tx_stop = True
+            self._tx_ev.set()
+            self._tx_thread.join(timeout=1.0)
+        
+        # 关闭套接字（close本身不等待FIN/ACK；不设SO_LINGER=0，以免丢弃尚未送达的挂断通知）
         if self.message_socket:
             self.message_socket.close()
         if self.audio_socket:
             self.audio_socket.close()
         if self.control_socket:
             self.control_socket.close()
-        
-        # 清理音频
-        if self.audio_instance:
-            self.audio_instance.terminate()
+        if self._shutdown_r:
+            self._shutdown_r.close()
+            self._shutdown_w.close()
         
         print("已断开连接")
 
 
-def main():
-    """主函数"""
+def _build_arg_parser():
+    """完整的argparse解析器，仅在需要帮助信息或参数有误时才导入"""
+    import argparse
     parser = argparse.ArgumentParser(description='云VoIP客户端')
     parser.add_argument('--server', required=True, help='服务器IP地址')
     parser.add_argument('--name', help='客户端名称')
     parser.add_argument('--port', type=int, default=5060, help='服务器端口 (默认: 5060)')
     parser.add_argument('--auto-reconnect', action='store_true', help='自动重连模式')
-    
-    args = parser.parse_args()
+    return parser
+
+
+def _parse_args(argv):
+    """
+    解析命令行参数
+    常见的合法参数直接扫描解析，省去导入argparse的开销；
+    遇到--help、未知参数或格式错误时交给argparse，输出与原来一致的帮助和错误信息
+    """
+    args = SimpleNamespace(server=None, name=None, port=5060, auto_reconnect=False)
+    it = iter(argv)
+    try:
+        for tok in it:
+            opt, eq, value = tok.partition('=')
+            if opt == '--auto-reconnect' and not eq:
+                args.auto_reconnect = True
+            elif opt in ('--server', '--name', '--port'):
+                if not eq:
+                    value = next(it)
+                    if value.startswith('-'):
+                        raise ValueError(tok)
+                if opt == '--port':
+                    args.port = int(value)
+                else:
+                    setattr(args, opt[2:], value)
+            else:
+                raise ValueError(tok)
+    except (StopIteration, ValueError):
+        return _build_arg_parser().parse_args(argv)
+    if args.server is None:
+        return _build_arg_parser().parse_args(argv)
+    return args
+
+
+def main():
+    """主函数"""
+    args = _parse_args(sys.argv[1:])
     
     if args.auto_reconnect:
         # 自动重连模式
         retry_count = 0
         max_retries = 3
+        stable_session = 30.0  # 连接保持超过该秒数后，断开时重新计算重试次数
+        client = None
+        
+        # 各次重连共享一个PyAudio实例，PortAudio只初始化一次
+        shared_audio = None
+        if AUDIO_AVAILABLE:
+            try:
+                shared_audio = pyaudio.PyAudio()
+            except Exception as e:
+                print(f"音频初始化失败: {e}")
         
         while retry_count < max_retries:
             try:
                 if retry_count > 0:
                     print(f"\n🔄 第 {retry_count + 1} 次连接尝试...")
-                    time.sleep(2)
+                    # 指数退避加随机抖动：0.25s、0.5s、1s……最长8s
+                    time.sleep(min(8.0, 0.25 * (2 ** (retry_count - 1))) + random.random() * 0.1)
                 
                 client = CloudVoIPClient(
                     server_ip=args.server,
                     client_name=args.name,
-                    base_port=args.port
+                    base_port=args.port,
+                    audio_instance=shared_audio
                 )
                 
+                session_time = 0.0
                 if client.connect():
                     print(f"✅ 连接成功 (第 {retry_count + 1} 次尝试)")
+                    last_success = time.monotonic()
                     client.interactive_mode()
+                    session_time = time.monotonic() - last_success
                 else:
                     print(f"❌ 连接失败 (第 {retry_count + 1} 次尝试)")
                 
                 # 连接断开后检查是否用户主动退出
                 user_quit = not client.running
                 client.disconnect()
-                retry_count += 1
+                # 长时间稳定的连接断开后重新开始计数，避免一次断线就耗尽重试次数
+                retry_count = 1 if session_time > stable_session else retry_count + 1
                 
                 # 如果是正常退出(用户输入quit)，则不重连
                 if user_quit:
@@ -1723,6 +2933,12 @@ def main():
             except Exception as e:
                 print(f"❌ 客户端异常: {e}")
                 retry_count += 1
+        
+        if shared_audio is not None:
+            # 等最后一个客户端在后台关闭音频流后再释放PortAudio
+            if client is not None and client._audio_finalizer is not None:
+                client._audio_finalizer.join(2.0)
+            _finalize_audio(shared_audio)
                 
         print("📞 自动重连已结束")
     else:
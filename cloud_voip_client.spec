@@ -16,9 +16,10 @@ a = Analysis(
         'socket',
         'json',
         'struct',
-        'uuid',
         'argparse',
         'warnings',
+        # build_dsp.py预编译的音频内核模块，存在时一并打包，运行时无需numba也无需JIT编译
+        'voip_dsp',
     ],
     hookspath=[],
     hooksconfig={},
@@ -42,6 +42,70 @@ except ImportError:
     AUDIO_AVAILABLE = False
     print("警告: pyaudio未安装，语音功能将不可用")
 
+# 优先使用orjson进行消息编解码（直接输入输出bytes），不可用时回退到标准库json
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+    _loads = json.loads
+
+# 可选msgpack信令编码：按首字节识别客户端发来的格式（JSON对象以'{'开头），
+# 并用同一格式回复该客户端，未启用msgpack的旧客户端不受影响
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+
+def _is_msgpack(data):
+    return MSGPACK_AVAILABLE and len(data) > 0 and data[0] != 0x7b
+
+# 逐包音频调试日志开关：音频中转是热路径，默认关闭以避免每个包都格式化日志
+DEBUG_AUDIO = False
+
+# 消息长度前缀（4字节无符号整数，固定小端序，避免依赖主机字节序）
+_LEN = struct.Struct('<I')
+
+
+def _send_framed(sock, data):
+    """
+    发送带长度前缀的消息
+    支持sendmsg的平台上使用分散写，避免拼接包头和消息体；并处理部分写入
+
+    部分写入时一条消息要分多次系统调用写出，调用方必须持有该套接字的发送锁
+    """
+    header = _LEN.pack(len(data))
+    if hasattr(sock, 'sendmsg'):
+        sent = sock.sendmsg([header, data])
+        # 部分写入时只补发剩余部分，不再拼接整条消息
+        if sent < len(header):
+            sock.sendall(header[sent:])
+            sock.sendall(data)
+        elif sent < len(header) + len(data):
+            sock.sendall(memoryview(data)[sent - len(header):])
+    else:
+        sock.sendall(header + data)
+
+
+# 接收时尽量让内核一次凑满请求的字节数（不支持的平台退化为普通recv）
+_WAITALL = getattr(socket, 'MSG_WAITALL', 0)
+
+
+def _recv_exact_into(sock, buf, n):
+    """读满n字节到buf中，连接关闭时返回False"""
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        got = sock.recv_into(view[pos:n], n - pos, _WAITALL)
+        if not got:
+            return False
+        pos += got
+    return True
+
 
 class CloudVoIPServer:
     def __init__(self, host: str = "0.0.0.0", base_port: int = 5060):
@@ -76,6 +140,8 @@ class CloudVoIPServer:
         self.clients = {}  # {client_id: ClientInfo}
         self.client_sockets = {}  # {client_id: socket}
         self.client_audio_addrs = {}  # {client_id: (ip, port)} - 实际音频地址
+        self.msgpack_sockets = set()  # 使用msgpack编码信令的客户端套接字
+        self.send_locks = {}  # {socket: Lock} 每个客户端套接字的发送锁，保证整条消息连续写出
         self.rooms = {}  # {room_id: [client_ids]}
         self.calls = {}  # {call_id: {caller, callee, status}}
         
@@ -181,6 +247,9 @@ class CloudVoIPServer:
         """初始化音频服务器"""
         try:
             self.audio_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # 所有通话的音频都经由这一个套接字中转，加大收发缓冲区以吸收突发流量（内核会按上限截断）
+            self.audio_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            self.audio_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
             self.audio_socket.bind((self.host, self.audio_port))
             self.audio_socket.settimeout(1.0)  # 设置超时，避免阻塞
             
@@ -334,13 +403,15 @@ class CloudVoIPServer:
                 if client_info['status'] == 'online':
                     clients_to_check.append((client_id, client_info['socket']))
         
-        # 发送心跳消息
+        # 发送心跳消息（所有客户端收到的内容相同，每种编码格式只序列化一次）
         sent_count = 0
         failed_clients = []
+        encoded = {}
         
         for client_id, client_socket in clients_to_check:
             try:
-                self.send_message(client_socket, heartbeat_msg)
+                heartbeat_data = self.encode_message(client_socket, heartbeat_msg, encoded)
+                self.send_encoded(client_socket, heartbeat_data, 'heartbeat')
                 sent_count += 1
             except Exception as e:
                 self.logger.warning(f"向客户端 {client_id} 发送心跳失败: {e}")
@@ -425,6 +496,8 @@ class CloudVoIPServer:
         while self.running:
             try:
                 client_sock, addr = self.message_socket.accept()
+                # 关闭Nagle算法，降低信令消息的往返延迟
+                client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 self.logger.info(f"新客户端连接到消息服务: {addr}")
                 
                 # 为每个客户端创建处理线程
@@ -444,6 +517,8 @@ class CloudVoIPServer:
         while self.running:
             try:
                 client_sock, addr = self.control_socket.accept()
+                # 控制通道同样是小消息一问一答，关闭Nagle算法
+                client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 self.logger.info(f"新客户端连接到控制服务: {addr}")
                 
                 # 为每个客户端创建处理线程
@@ -464,7 +539,8 @@ class CloudVoIPServer:
         while self.running:
             try:
                 data, addr = self.audio_socket.recvfrom(4096)
-                self.logger.debug(f"收到音频数据包: {len(data)} 字节 from {addr}")
+                if DEBUG_AUDIO:
+                    self.logger.debug(f"收到音频数据包: {len(data)} 字节 from {addr}")
                 
                 # 解析音频数据包头部（新格式：16字节源ID + 16字节目标ID + 音频数据）
                 if len(data) > 32:
@@ -476,9 +552,11 @@ class CloudVoIPServer:
                     # 更新源客户端的实际音频地址
                     if source_id:
                         self.client_audio_addrs[source_id] = addr
-                        self.logger.debug(f"更新客户端 {source_id} 音频地址为: {addr}")
+                        if DEBUG_AUDIO:
+                            self.logger.debug(f"更新客户端 {source_id} 音频地址为: {addr}")
                     
-                    self.logger.debug(f"音频转发: {source_id} -> {target_id}, 数据长度: {len(audio_data)}")
+                    if DEBUG_AUDIO:
+                        self.logger.debug(f"音频转发: {source_id} -> {target_id}, 数据长度: {len(audio_data)}")
                     
                     # 转发音频数据
                     self.forward_audio(source_id, target_id, audio_data, addr)
@@ -494,32 +572,30 @@ class CloudVoIPServer:
     def handle_message_client(self, client_sock: socket.socket, addr: Tuple[str, int]):
         """处理消息客户端"""
         client_id = None
+        header = bytearray(_LEN.size)
         try:
             while self.running:
-                # 接收消息长度
-                length_data = client_sock.recv(4)
-                if not length_data:
+                # 接收消息长度（读满4字节，避免短读导致解析错位）
+                if not _recv_exact_into(client_sock, header, _LEN.size):
                     break
                 
-                msg_length = struct.unpack('I', length_data)[0]
+                msg_length = _LEN.unpack_from(header)[0]
                 if msg_length > 1024 * 1024:  # 1MB限制
                     self.logger.warning(f"消息长度过大: {msg_length}")
                     break
                 
-                # 接收完整消息
-                data = b''
-                while len(data) < msg_length:
-                    chunk = client_sock.recv(min(msg_length - len(data), 4096))
-                    if not chunk:
-                        break
-                    data += chunk
-                
-                if len(data) != msg_length:
+                # 接收完整消息：一次分配好缓冲区，直接写入，不再逐块拼接
+                data = bytearray(msg_length)
+                if not _recv_exact_into(client_sock, data, msg_length):
                     break
                 
                 # 解析消息
                 try:
-                    message = json.loads(data.decode('utf-8'))
+                    if _is_msgpack(data):
+                        message = msgpack.unpackb(data, raw=False)
+                        self.msgpack_sockets.add(client_sock)
+                    else:
+                        message = _loads(data)
                     client_id = message.get('client_id', client_id)
                     
                     # 更新客户端信息
@@ -542,12 +618,14 @@ class CloudVoIPServer:
                     # 处理不同类型的消息
                     self.process_message(message, client_sock, addr, client_id)
                     
-                except json.JSONDecodeError as e:
-                    self.logger.error(f"JSON解析错误: {e}")
+                except ValueError as e:  # JSON和msgpack的解析错误都是ValueError子类
+                    self.logger.error(f"消息解析错误: {e}")
                     
         except Exception as e:
             self.logger.error(f"处理消息客户端错误: {e}")
         finally:
+            self.msgpack_sockets.discard(client_sock)
+            self.send_locks.pop(client_sock, None)
             # 清理客户端
             if client_id:
                 with self.clients_lock:
@@ -574,7 +652,7 @@ class CloudVoIPServer:
                     break
                 
                 try:
-                    message = json.loads(data.decode('utf-8'))
+                    message = _loads(data)
                     self.process_control_message(message, client_sock, addr)
                 except json.JSONDecodeError:
                     pass
@@ -582,6 +660,7 @@ class CloudVoIPServer:
         except Exception as e:
             self.logger.error(f"处理控制客户端错误: {e}")
         finally:
+            self.send_locks.pop(client_sock, None)
             try:
                 client_sock.close()
             except:
@@ -661,14 +740,20 @@ class CloudVoIPServer:
             'timestamp': time.time()
         }
         
-        # 发送给所有在线客户端
+        # 先在锁内取出接收者，再逐个发送：发送时要等待各套接字的发送锁，
+        # 不能在持有clients_lock时等待，否则一个慢客户端会卡住所有需要客户端表的线程
         with self.clients_lock:
-            for client_id, client_info in self.clients.items():
-                if client_id != sender_id and client_info['status'] == 'online':
-                    try:
-                        self.send_message(client_info['socket'], broadcast_msg)
-                    except:
-                        pass
+            recipients = [client_info['socket'] for client_id, client_info in self.clients.items()
+                          if client_id != sender_id and client_info['status'] == 'online']
+        
+        # 发送给所有在线客户端（每种编码格式只序列化一次）
+        encoded = {}
+        for client_socket in recipients:
+            try:
+                broadcast_data = self.encode_message(client_socket, broadcast_msg, encoded)
+                self.send_encoded(client_socket, broadcast_data, 'broadcast')
+            except:
+                pass
         
         self.logger.info(f"广播消息 from {sender_id}: {content}")
 
@@ -720,6 +805,9 @@ class CloudVoIPServer:
             'from': caller_id,
             'timestamp': time.time()
         }
+        if message.get('multi_frame'):
+            # 主叫能接收多帧合并的音频包（音频中转只按包头转发，不关心负载格式）
+            call_request['multi_frame'] = True
         
         with self.clients_lock:
             if callee_id in self.clients and self.clients[callee_id]['status'] == 'online':
@@ -754,6 +842,9 @@ class CloudVoIPServer:
                     'from': client_id,
                     'timestamp': time.time()
                 }
+                if message.get('multi_frame'):
+                    # 被叫能接收多帧合并的音频包
+                    response['multi_frame'] = True
                 
                 with self.clients_lock:
                     if caller_id in self.clients:
@@ -902,7 +993,8 @@ class CloudVoIPServer:
         """转发音频数据"""
         try:
             if len(audio_data) > 0:
-                self.logger.debug(f"转发音频数据: {source_id} -> {target_id}, {len(audio_data)} bytes")
+                if DEBUG_AUDIO:
+                    self.logger.debug(f"转发音频数据: {source_id} -> {target_id}, {len(audio_data)} bytes")
                 
                 # 查找目标客户端的音频地址（优先使用实际音频地址）
                 target_audio_addr = None
@@ -910,7 +1002,8 @@ class CloudVoIPServer:
                 # 首先尝试使用记录的实际音频地址
                 if target_id in self.client_audio_addrs:
                     target_audio_addr = self.client_audio_addrs[target_id]
-                    self.logger.debug(f"使用已记录的音频地址: {target_audio_addr}")
+                    if DEBUG_AUDIO:
+                        self.logger.debug(f"使用已记录的音频地址: {target_audio_addr}")
                 else:
                     # 如果没有实际地址，尝试使用注册时的信息
                     with self.clients_lock:
@@ -921,7 +1014,8 @@ class CloudVoIPServer:
                                 client_ip = client_info['addr'][0]
                                 audio_port = client_info['audio_port']
                                 target_audio_addr = (client_ip, audio_port)
-                                self.logger.debug(f"使用注册时的音频地址: {target_audio_addr}")
+                                if DEBUG_AUDIO:
+                                    self.logger.debug(f"使用注册时的音频地址: {target_audio_addr}")
                 
                 if target_audio_addr:
                     # 重新构造数据包（保持原格式，让接收端能正确解析）
@@ -931,7 +1025,8 @@ class CloudVoIPServer:
                     
                     # 转发到目标客户端
                     self.audio_socket.sendto(packet, target_audio_addr)
-                    self.logger.debug(f"音频数据已转发到 {target_audio_addr}")
+                    if DEBUG_AUDIO:
+                        self.logger.debug(f"音频数据已转发到 {target_audio_addr}")
                 else:
                     self.logger.warning(f"找不到目标客户端 {target_id} 的音频地址或客户端不在线")
         except Exception as e:
@@ -940,11 +1035,37 @@ class CloudVoIPServer:
     def send_message(self, client_sock: socket.socket, message: Dict[str, Any]):
         """发送消息给客户端"""
         try:
-            data = json.dumps(message).encode('utf-8')
-            length = struct.pack('I', len(data))
-            msg_type = message.get('type', 'unknown')
+            data = self.encode_message(client_sock, message)
+        except Exception as e:
+            self.logger.error(f"发送消息失败: {e}")
+            return
+        self.send_encoded(client_sock, data, message.get('type', 'unknown'))
+
+    def encode_message(self, client_sock: socket.socket, message: Dict[str, Any], cache: Optional[Dict[bool, bytes]] = None) -> bytes:
+        """按客户端使用的格式序列化消息；传入cache时每种格式只序列化一次"""
+        use_msgpack = client_sock in self.msgpack_sockets
+        if cache is not None and use_msgpack in cache:
+            return cache[use_msgpack]
+        data = msgpack.packb(message, use_bin_type=True) if use_msgpack else _dumps(message)
+        if cache is not None:
+            cache[use_msgpack] = data
+        return data
+
+    def _send_lock(self, client_sock: socket.socket) -> threading.Lock:
+        """取得客户端套接字的发送锁，首次使用时创建"""
+        lock = self.send_locks.get(client_sock)
+        if lock is None:
+            lock = self.send_locks.setdefault(client_sock, threading.Lock())
+        return lock
+
+    def send_encoded(self, client_sock: socket.socket, data: bytes, msg_type: str):
+        """发送已序列化的消息，同一消息发给多个客户端时避免重复序列化"""
+        try:
             self.logger.info(f"[DEBUG] 准备发送消息类型 {msg_type}，数据长度: {len(data)}")
-            client_sock.send(length + data)
+            # 心跳线程、广播和各客户端处理线程都会写同一个套接字，
+            # 一条消息可能分多次系统调用写出，持锁保证不同消息的字节不会交错
+            with self._send_lock(client_sock):
+                _send_framed(client_sock, data)
             self.logger.info(f"[DEBUG] 消息 {msg_type} 发送成功")
         except Exception as e:
             self.logger.error(f"发送消息失败: {e}")
@@ -1062,15 +1183,20 @@ class CloudVoIPServer:
                         'timestamp': time.time()
                     }
                     
-                    sent_count = 0
+                    # 与handle_broadcast_message相同：锁内取出接收者，锁外发送，每种编码格式只序列化一次
                     with self.clients_lock:
-                        for client_id, client_info in self.clients.items():
-                            if client_info['status'] == 'online':
-                                try:
-                                    self.send_message(client_info['socket'], broadcast_msg)
-                                    sent_count += 1
-                                except:
-                                    pass
+                        recipients = [client_info['socket'] for client_info in self.clients.values()
+                                      if client_info['status'] == 'online']
+
+                    sent_count = 0
+                    encoded = {}
+                    for client_socket in recipients:
+                        try:
+                            broadcast_data = self.encode_message(client_socket, broadcast_msg, encoded)
+                            self.send_encoded(client_socket, broadcast_data, 'broadcast')
+                            sent_count += 1
+                        except:
+                            pass
                     
                     print(f"广播消息已发送给 {sent_count} 个客户端")
                 elif cmd == 'kick' and args:
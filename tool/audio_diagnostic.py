@@ -193,7 +193,8 @@ class AudioDiagnostic:
         reference_bytes = (reference_signal * 32767).astype(np.int16).tobytes()
         
         # 添加参考信号到历史记录
-        self.client.audio_history = [reference_bytes]
+        self.client.clear_echo_history()
+        self.client.add_echo_reference(reference_bytes)
         
         # 应用回声消除
         processed = self.client.apply_echo_cancellation(mixed_bytes, reference_bytes)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+音频内核测试脚本
+验证audio_dsp_numba中的内核（以及build_dsp.py生成的voip_dsp模块）
+能接受客户端实际传入的数据类型，结果与NumPy实现一致
+"""
+
+import sys
+import os
+import numpy as np
+
+# 添加项目路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import audio_dsp_numba as dsp
+
+
+def numpy_echo_scores(xcorr, lag, max_lag, input_norm, norms):
+    """回声相关性评分的NumPy参考实现（与客户端未启用内核时相同）"""
+    scores = np.abs(xcorr[:, :max_lag + 1].astype(np.float64)) / (input_norm * norms)[:, None]
+    peak = int(scores.argmax())
+    return (float(scores[:, lag].max()), float(scores[:, lag].sum()),
+            peak % (max_lag + 1), float(scores.flat[peak]))
+
+
+def test_echo_scores_irfft():
+    """用真实的irfft输出调用echo_scores，覆盖numpy 1.x返回float64的情况"""
+    print("🧪 测试echo_scores（irfft输出）...")
+    rng = np.random.default_rng(0)
+    n = 1024
+    frames = 3
+    ref = rng.standard_normal((frames, n)).astype(np.float32)
+    ref -= ref.mean(axis=1, keepdims=True)
+    inp = (0.6 * ref[1] + 0.1 * rng.standard_normal(n)).astype(np.float32)
+    inp -= inp.mean()
+    norms = np.sqrt((ref.astype(np.float64) ** 2).sum(axis=1))
+    input_norm = float(np.sqrt(float(inp @ inp)))
+    
+    # 与客户端相同：参考帧频谱为complex64，输入频谱与之共轭相乘后逆变换
+    ref_F = np.fft.rfft(ref, n=2 * n, axis=-1).astype(np.complex64)
+    input_F = np.fft.rfft(inp, n=2 * n)
+    ok = True
+    for label, spectrum in (("complex64", np.conj(ref_F) * input_F.astype(np.complex64)),
+                            ("complex128", np.conj(ref_F).astype(np.complex128) * input_F)):
+        raw = np.fft.irfft(spectrum, n=2 * n, axis=-1)
+        xcorr = raw.astype(np.float32, copy=False)
+        expected = numpy_echo_scores(xcorr, 3, 160, input_norm, norms)
+        try:
+            result = dsp.echo_scores(xcorr, 3, 160, input_norm, norms)
+        except TypeError as e:
+            print(f"  ❌ {label} -> irfft输出{raw.dtype}: 内核拒绝参数: {e}")
+            ok = False
+            continue
+        match = np.allclose(result, expected, rtol=1e-5)
+        print(f"  {'✅' if match else '❌'} {label} -> irfft输出{raw.dtype}: {result} / 期望 {expected}")
+        ok = ok and match
+    return ok
+
+
+def _make_client(client_module, use_kernel):
+    """创建关闭/启用内核的客户端并初始化音频处理"""
+    client_module.NUMBA_AVAILABLE = use_kernel
+    client = client_module.CloudVoIPClient("127.0.0.1", "TestClient")
+    client.audio_processing_init()
+    return client
+
+
+def _speech_like(rng, n, scale=12000):
+    """一阶自回归(0.99)的低频信号，相邻采样高度相关，接近语音的频谱特性"""
+    x = np.empty(n)
+    prev = 0.0
+    for i, w in enumerate(rng.standard_normal(n)):
+        prev = 0.99 * prev + w
+        x[i] = prev
+    return (x / np.abs(x).max() * scale).astype(np.int16)
+
+
+def test_client_echo_scores():
+    """客户端回声检测启用内核与不启用内核时结论一致"""
+    print("🧪 测试客户端回声检测（内核与NumPy实现）...")
+    import cloud_voip_client as client_module
+    
+    rng = np.random.default_rng(1)
+    ref = (rng.standard_normal(1024) * 6000).astype(np.int16)
+    echo = (ref * 0.8).astype(np.int16).tobytes()
+    results = []
+    original = client_module.NUMBA_AVAILABLE
+    try:
+        for use_kernel in (False, True):
+            client = _make_client(client_module, use_kernel)
+            for _ in range(3):
+                client.add_echo_reference(ref.tobytes())
+            samples = client._to_float32(echo).copy()
+            results.append(client._echo_suppress_f32(samples))
+    finally:
+        client_module.NUMBA_AVAILABLE = original
+    
+    # 输入就是参考信号的回声，两种实现都应检测到并衰减
+    input_peak = float(np.abs(client._to_float32(echo)).max())
+    suppressed = all(float(np.abs(r).max()) < input_peak for r in results)
+    match = np.allclose(results[0], results[1], atol=1e-6)
+    print(f"  {'✅' if suppressed else '❌'} 回声{'已' if suppressed else '未'}被抑制")
+    print(f"  {'✅' if match else '❌'} NumPy与内核结果{'一致' if match else '不一致'}")
+    return suppressed and match
+
+
+def test_client_delayed_echo():
+    """延迟的回声：跟踪到延迟后在该延迟处评分并抑制"""
+    print("🧪 测试客户端延迟回声检测...")
+    import cloud_voip_client as client_module
+    
+    rng = np.random.default_rng(2)
+    delay = 200
+    ref = (rng.standard_normal(1024) * 6000).astype(np.int16)
+    echo = np.concatenate([(rng.standard_normal(delay) * 600).astype(np.int16),
+                           (ref[:-delay] * 0.8).astype(np.int16)]).tobytes()
+    ok = True
+    original = client_module.NUMBA_AVAILABLE
+    try:
+        for use_kernel in (False, True):
+            client = _make_client(client_module, use_kernel)
+            for _ in range(3):
+                client.add_echo_reference(ref.tobytes())
+            # 前两帧用于确认延迟，第三帧起在跟踪到的延迟处检测
+            for _ in range(3):
+                samples = client._to_float32(echo).copy()
+                result = client._echo_suppress_f32(samples)
+            suppressed = not np.array_equal(result, samples)
+            label = "内核" if use_kernel else "NumPy"
+            print(f"  {'✅' if suppressed else '❌'} {label}: 跟踪延迟 {client._echo_lag} / 实际 {delay}，"
+                  f"回声{'已' if suppressed else '未'}被抑制")
+            ok = ok and suppressed and client._echo_lag == delay
+    finally:
+        client_module.NUMBA_AVAILABLE = original
+    return ok
+
+
+def test_client_independent_signals():
+    """参考信号与输入互相独立（类似语音的低频信号）时不应被当作回声衰减"""
+    print("🧪 测试客户端回声检测（独立信号不抑制）...")
+    import cloud_voip_client as client_module
+    
+    frames = 200
+    ok = True
+    original = client_module.NUMBA_AVAILABLE
+    try:
+        for use_kernel in (False, True):
+            rng = np.random.default_rng(3)
+            client = _make_client(client_module, use_kernel)
+            hits = 0
+            for _ in range(frames):
+                client.add_echo_reference(_speech_like(rng, client.chunk).tobytes())
+                samples = client._to_float32(_speech_like(rng, client.chunk).tobytes()).copy()
+                hits += not np.array_equal(client._echo_suppress_f32(samples), samples)
+            # 单一延迟的相关系数在该阈值下的误检率约为几个百分点，远低于各延迟取最大值时
+            passed = hits <= frames * 0.08
+            label = "内核" if use_kernel else "NumPy"
+            print(f"  {'✅' if passed else '❌'} {label}: {hits}/{frames} 帧被误判为回声")
+            ok = ok and passed
+    finally:
+        client_module.NUMBA_AVAILABLE = original
+    return ok
+
+
+def test_client_fused_input():
+    """融合内核（_input_fused）与通用浮点流程（_input_general）的输出一致，最多相差1个LSB"""
+    print("🧪 测试融合输入处理与通用流程...")
+    import cloud_voip_client as client_module
+    
+    rng = np.random.default_rng(4)
+    frames = 0
+    differing = 0
+    max_diff = 0
+    original = client_module.NUMBA_AVAILABLE
+    try:
+        client = _make_client(client_module, True)
+        client.echo_cancellation = False
+        client.spectral_subtraction = False
+        for volume in (0.7, 1.0, 1.5):
+            for gate, agc in ((True, False), (False, True), (True, True)):
+                client.input_volume = volume
+                client.noise_suppression = gate
+                client.auto_gain_control = agc
+                client._build_input_pipeline()
+                if client._input_stage != client._input_fused:
+                    print("  ❌ 关闭回声消除后未选用融合内核")
+                    return False
+                for _ in range(40):
+                    # 幅度覆盖噪声门阈值以下到接近满幅
+                    amp = 10 ** rng.uniform(0.5, 4.4)
+                    data = np.clip(rng.standard_normal(client.chunk) * amp, -32768, 32767).astype(np.int16).tobytes()
+                    fused = np.frombuffer(client._input_fused(data), dtype=np.int16).astype(np.int32)
+                    general = np.frombuffer(client._input_general(data), dtype=np.int16).astype(np.int32)
+                    diff = int(np.abs(fused - general).max())
+                    frames += 1
+                    differing += diff > 0
+                    max_diff = max(max_diff, diff)
+    finally:
+        client_module.NUMBA_AVAILABLE = original
+    
+    # 通用流程的RMS来自float32点积，自动增益系数偶尔相差1ulp，个别采样会相差1个LSB
+    passed = max_diff <= 1 and differing <= frames * 0.02
+    print(f"  {'✅' if passed else '❌'} {differing}/{frames} 帧存在差异，最大差值 {max_diff} LSB")
+    return passed
+
+
+def main():
+    """主测试函数"""
+    print("🎵 音频内核测试")
+    print(f"  numba可用: {dsp.NUMBA_AVAILABLE}，预编译模块voip_dsp: {dsp.AOT_AVAILABLE}")
+    print("=" * 50)
+    
+    results = [test_echo_scores_irfft(), test_client_echo_scores(),
+               test_client_delayed_echo(), test_client_independent_signals(),
+               test_client_fused_input()]
+    
+    if all(results):
+        print("\n🎉 所有测试通过！")
+        return 0
+    print("\n❌ 有测试失败")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())